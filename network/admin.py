@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import User, Post
+from .models import User, Post, Hashtag
 
 admin.site.register(User)
 admin.site.register(Post)
+admin.site.register(Hashtag)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class NetworkConfig(AppConfig):
     name = 'network'
+
+    def ready(self):
+        # register signal handlers
+        from . import profiling, signals, slowlog, writer
@@ -0,0 +1,151 @@
+"""
+Async versions of the JSON API routes for serving under ASGI (project4/asgi.py).
+
+Reads use the async ORM, so the event loop is free while the database
+works. Writes that need a transaction (likes, follows, new posts) run the
+model methods through the write path of writer.py, as the async ORM has no
+transactions.
+Requires Django 5.1+ (async login_required and request.auser()).
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse, JsonResponse
+
+from . import likes, writer
+from .models import User, Post
+from .views import get_ids, post_response, posts_response
+
+
+@login_required
+async def post(request, post_id):
+    user = await request.auser()
+
+    # Query for requested post
+    try:
+        post = await Post.objects.feed(user).aget(pk=post_id)
+    except Post.DoesNotExist:
+        return JsonResponse({"error": "Post not found."}, status=404)
+
+    # Return post contents, or 304 if the client already has this version
+    if request.method == "GET":
+        return post_response(request, post, user)
+
+    # Update post data
+    elif request.method == "PUT":
+        data = json.loads(request.body)
+
+        if data.get("post_content") is not None:
+            # if request user is not the creator of the post then deny access
+            if post.created_by_id != user.id:
+                return HttpResponse(status=403)
+            else:
+                await writer.awrite(post.edit, data["post_content"])
+
+        if data.get("liking") is not None:
+            await sync_to_async(likes.set_liking)(post, user, bool(data["liking"]))
+
+        return HttpResponse(status=204)
+
+    # post must be via GET or PUT
+    else:
+        return JsonResponse({
+            "error": "GET or PUT request required."
+        }, status=400)
+
+
+async def posts(request):
+    """ Batch fetch of posts by ?ids= (GET, open to anonymous clients like the feeds) or new post (POST). """
+    if request.method == "GET" and 'ids' in request.GET:
+        return await get_posts(request)
+    return await create_post(request)
+
+
+async def get_posts(request):
+    """ Returns the posts listed in ?ids=1,2,3 (at most 100) as JSON, unknown ids are left out. """
+    user = await request.auser()
+    post_ids = get_ids(request)
+    if post_ids is None:
+        return JsonResponse({"error": "Invalid post ids."}, status=400)
+
+    posts = await Post.objects.filter(id__in=post_ids).feed(user).ain_bulk()
+    return posts_response(post_ids, posts, user)
+
+
+@login_required
+async def create_post(request):
+    user = await request.auser()
+
+    # creating a new post must be via POST
+    if request.method != "POST":
+        return JsonResponse({"error": "POST request required."}, status=400)
+
+    # Check post content
+    data = json.loads(request.body)
+    post_content = data.get("post_content")
+    if len(post_content) == 0:
+        return JsonResponse({
+            "error": "At least one character required."
+        }, status=400)
+
+    # add post (creator's counter and followers' timelines are updated on save)
+    post = Post(
+        created_by=user,
+        content=post_content
+    )
+    await writer.awrite(post.save)
+
+    return JsonResponse({"message": "Post created successfully."}, status=201)
+
+
+@login_required
+async def follow(request, user_id):
+    user = await request.auser()
+
+    # Query for requested user
+    try:
+        p_user = await User.objects.aget(pk=user_id)
+    except User.DoesNotExist:
+        return JsonResponse({"error": "User not found."}, status=404)
+
+    # Return follow status: True if logged in user is following profile user
+    if request.method == "GET":
+        return JsonResponse({
+            'isfollowing': await User.followed_by.through.objects.filter(from_user=p_user, to_user=user).aexists()
+        })
+
+    # Update following: if True then logged in user will follow profile user
+    elif request.method == "PUT":
+        data = json.loads(request.body)
+        if data.get('isfollowing') is not None:
+            if data['isfollowing']:
+                await writer.awrite(user.follow, p_user)
+            else:
+                await writer.awrite(user.unfollow, p_user)
+        return HttpResponse(status=204)
+
+    # follow must be via GET or PUT
+    else:
+        return JsonResponse({
+            "error": "GET or PUT request required."
+        }, status=400)
+
+
+@login_required
+async def follow_statuses(request):
+    """ Returns follow status of the logged in user for every user in ?ids=1,2,3 """
+    user = await request.auser()
+
+    # follow statuses must be via GET
+    if request.method != "GET":
+        return JsonResponse({"error": "GET request required."}, status=400)
+
+    user_ids = get_ids(request)
+    if user_ids is None:
+        return JsonResponse({"error": "Invalid user ids."}, status=400)
+
+    followed_ids = await user.aget_followed_ids(user_ids)
+    return JsonResponse({
+        'isfollowing': {str(user_id): user_id in followed_ids for user_id in user_ids}
+    })
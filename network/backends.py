@@ -0,0 +1,64 @@
+"""
+Authentication backend that keeps logged in users in the cache.
+
+AuthenticationMiddleware loads request.user on every request. With the
+cached_db session engine and this backend both come from the cache, so a
+logged in page view needs no query for identity. The cached copy defers the
+denormalized counters, which change without User.save(): reading one loads
+the current value, and saving the copy never writes stale counters back. Any
+save or delete of a user (profile, image or password changes) drops the
+copy, and logging in caches a fresh one. With several processes the cache
+must be shared (see CACHES), else other processes keep serving the old copy
+for up to USER_CACHE_TIMEOUT seconds. The user is loaded from the primary,
+a lagging replica would put the old password hash or is_active in the cache.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import User
+
+
+# changed by QuerySet.update(), the cached copy must not hold them
+COUNTER_FIELDS = ('posts_count', 'followers_count', 'following_count')
+
+
+def user_cache_key(user_id):
+    return f'user:{user_id}'
+
+
+def load_user(user_id):
+    """ Returns the user with the counters deferred and puts it in the cache, or None if there is no such user. """
+    user = User.objects.db_manager(DEFAULT_DB_ALIAS).defer(*COUNTER_FIELDS).filter(pk=user_id).first()
+    timeout = getattr(settings, 'USER_CACHE_TIMEOUT', 0)
+    if user is not None and timeout:
+        cache.set(user_cache_key(user_id), user, timeout)
+    return user
+
+
+def invalidate_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """ ModelBackend reading request.user from the cache for USER_CACHE_TIMEOUT seconds, 0 disables the cache. """
+
+    def get_user(self, user_id):
+        user = None
+        if getattr(settings, 'USER_CACHE_TIMEOUT', 0):
+            user = cache.get(user_cache_key(user_id))
+        if user is None:
+            user = load_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        user = None
+        if getattr(settings, 'USER_CACHE_TIMEOUT', 0):
+            user = await cache.aget(user_cache_key(user_id))
+        if user is None:
+            user = await User.objects.db_manager(DEFAULT_DB_ALIAS).defer(*COUNTER_FIELDS).filter(pk=user_id).afirst()
+            timeout = getattr(settings, 'USER_CACHE_TIMEOUT', 0)
+            if user is not None and timeout:
+                await cache.aset(user_cache_key(user_id), user, timeout)
+        return user if user is not None and self.user_can_authenticate(user) else None
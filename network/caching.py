@@ -0,0 +1,127 @@
+import functools
+import glob
+import hashlib
+import os
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import http_date
+
+
+INDEX_GENERATION_KEY = 'index-pages:generation'
+# how long a stale page may be served while one request re-renders it
+STALE_TIMEOUT = 300
+# how long the re-rendering request may hold the refresh lock
+LOCK_TIMEOUT = 10
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+
+def get_index_generation():
+    """ Returns the time of the last change that invalidated the cached index pages. """
+    return cache.get(INDEX_GENERATION_KEY, 0)
+
+
+def invalidate_index_pages():
+    """ Marks every cached index page stale, e.g. after a new post. """
+    cache.set(INDEX_GENERATION_KEY, time.time_ns(), None)
+
+
+def index_page_key(request):
+    """ Returns the cache key of the index page requested by page number or cursor. """
+    page = request.GET.get('page', '')
+    cursor = hashlib.md5(request.GET.get('cursor', '').encode()).hexdigest()
+    return f'index-pages:{page}:{cursor}'
+
+
+def get_or_refresh(key, generation, render, timeout):
+    """
+    Returns content cached under key, or renders it with render(). Once the entry
+    is older than timeout seconds or of an older generation only one caller
+    re-renders it, the others keep getting the stale content in the meantime.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        if entry['generation'] == generation and entry['expires'] > time.time():
+            return entry['content']
+        # stale: only the caller that gets the lock refreshes the entry
+        if not cache.add(f'{key}:lock', True, LOCK_TIMEOUT):
+            return entry['content']
+
+    try:
+        content = render()
+        cache.set(key, {
+            'generation': generation,
+            'expires': time.time() + timeout,
+            'content': content,
+        }, timeout + STALE_TIMEOUT)
+    finally:
+        if entry is not None:
+            cache.delete(f'{key}:lock')
+    return content
+
+
+def get_page_cache_timeout():
+    """ Returns how long anonymous pages stay fresh in seconds, 0 disables the page cache. """
+    return getattr(settings, 'ANONYMOUS_PAGE_CACHE_TIMEOUT', 0)
+
+
+@functools.lru_cache(maxsize=None)
+def get_template_version():
+    """ Returns a hash of the templates of the network app, so a deploy that changes markup changes the ETags. """
+    content = hashlib.md5()
+    for path in sorted(glob.glob(os.path.join(TEMPLATE_DIR, '**', '*.html'), recursive=True)):
+        with open(path, 'rb') as f:
+            content.update(f.read())
+    return content.hexdigest()
+
+
+def get_author_parts(user):
+    return (user.username, user.image.name) if user is not None else (None, None)
+
+
+def get_page_etag(request, page_obj, *extra):
+    """
+    Returns an ETag for a page of posts as seen by the user of request, extra
+    values are mixed in. Pages of logged in users render the CSRF token, which
+    changes at login, so its secret is part of the ETag as well, and posts
+    render the name and image of their creator.
+    """
+    if request.user.is_authenticated:
+        # makes sure the secret exists before the page is rendered
+        get_token(request)
+    parts = [
+        request.user.pk, request.META.get('CSRF_COOKIE'), get_template_version(),
+        page_obj.has_previous(), page_obj.has_next(), *extra
+    ]
+    parts += [
+        (post.id, post.version, post.likes_count, post.liked_by_viewer, *get_author_parts(post.created_by))
+        for post in page_obj
+    ]
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def get_post_etag(post):
+    """ Returns an ETag for a post loaded with Post.objects.feed(), as seen by that viewer. """
+    return f'post-{post.id}-{post.version}-{post.likes_count}-{post.liked_by_viewer}'
+
+
+def conditional_response(request, etag, render, last_modified=None, private=True):
+    """
+    Returns 304 Not Modified if the client already has the version described by
+    etag / last_modified (a timestamp), otherwise the response of render().
+    Either way clients are asked to revalidate before reusing their copy.
+    """
+    response = get_conditional_response(request, etag=quote_etag(etag), last_modified=last_modified)
+    if response is None:
+        response = render()
+    response['ETag'] = quote_etag(etag)
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    if private:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
@@ -0,0 +1,149 @@
+import atexit
+import logging
+import threading
+import time
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import metrics, writer
+from .models import Post, count_of
+
+
+logger = logging.getLogger(__name__)
+
+
+class LikeBuffer:
+    """
+    Collects like and unlike toggles in memory and writes them in one
+    transaction every interval seconds. Repeated toggles of the same user on
+    the same post collapse into the last one, toggles that restore the stored
+    state cancel out. While a flush writes, its toggles are in_flight and
+    count as the stored state.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        # (post_id, user_id) -> True to like, False to unlike
+        self.pending = {}
+        # toggles of the running flush, not committed yet
+        self.in_flight = {}
+        self.thread = None
+
+    def toggle(self, post, user, liking, is_liked):
+        """ Queues liking (True) or unliking (False) of post by user, is_liked is the stored state. """
+        key = (post.id, user.id)
+        with self.lock:
+            if liking == self.in_flight.get(key, is_liked):
+                self.pending.pop(key, None)
+            else:
+                self.pending[key] = liking
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='like-buffer', daemon=True)
+                self.thread.start()
+
+    def merge_pending(self, posts, viewer):
+        """ Adds pending toggles to likes_count and liked_by_viewer of loaded posts. """
+        with self.lock:
+            # pending toggles of in-flight keys are relative to the in-flight state
+            toggles = [*self.in_flight.items(), *self.pending.items()]
+            liked = {**self.in_flight, **self.pending}
+        if not toggles:
+            return
+        deltas = {}
+        for (post_id, _), liking in toggles:
+            deltas[post_id] = deltas.get(post_id, 0) + (1 if liking else -1)
+        for post in posts:
+            post.likes_count += deltas.get(post.id, 0)
+            if viewer.is_authenticated and (post.id, viewer.id) in liked:
+                post.liked_by_viewer = liked[(post.id, viewer.id)]
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        """ Writes the pending toggles in one transaction. """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.in_flight = pending
+        if not pending:
+            return
+        try:
+            writer.write(write_likes, pending)
+        except Exception:
+            logger.exception('Writing %d buffered likes failed, they are retried with the next flush.', len(pending))
+            with self.lock:
+                # a toggle of an in-flight key that arrived in the meantime undid it, both cancel out
+                self.pending = {
+                    key: pending.get(key, self.pending.get(key)) for key in pending.keys() ^ self.pending.keys()
+                }
+                self.in_flight = {}
+        else:
+            with self.lock:
+                self.in_flight = {}
+
+
+def write_likes(pending):
+    """
+    Inserts and deletes likes of {(post_id, user_id): liking} and recounts the
+    affected posts, in the transaction of writer.write().
+    """
+    Like = Post.liked_by.through
+    likes = [key for key, liking in pending.items() if liking]
+    unlikes = [key for key, liking in pending.items() if not liking]
+    post_ids = {post_id for post_id, _ in pending}
+
+    Like.objects.bulk_create(
+        [Like(post_id=post_id, user_id=user_id) for post_id, user_id in likes], ignore_conflicts=True
+    )
+    if unlikes:
+        Like.objects.filter(
+            reduce(or_, [Q(post_id=post_id, user_id=user_id) for post_id, user_id in unlikes])
+        ).delete()
+    # the buffer only keeps toggles that change the stored state
+    metrics.count_on_commit('network_likes_total', len(likes))
+    metrics.count_on_commit('network_unlikes_total', len(unlikes))
+    Post.objects.filter(pk__in=post_ids).update(
+        likes_count=count_of(Like.objects.all(), 'post'), version=F('version') + 1, modified_time=timezone.now()
+    )
+
+
+like_buffer = None
+like_buffer_lock = threading.Lock()
+
+
+def get_like_buffer():
+    """ Returns the buffer of this process, or None if LIKE_BUFFER_INTERVAL is not set. """
+    global like_buffer
+    interval = getattr(settings, 'LIKE_BUFFER_INTERVAL', 0)
+    if not interval:
+        return None
+    with like_buffer_lock:
+        if like_buffer is None:
+            like_buffer = LikeBuffer(interval)
+            atexit.register(like_buffer.flush)
+    return like_buffer
+
+
+def set_liking(post, user, liking):
+    """ Likes or unlikes post by user, through the buffer if it is enabled. post must come from Post.objects.feed(user). """
+    buffer = get_like_buffer()
+    if buffer is not None:
+        buffer.toggle(post, user, liking, post.liked_by_viewer)
+    elif liking:
+        writer.write(post.like, user)
+    else:
+        writer.write(post.unlike, user)
+
+
+def merge_pending(posts, viewer):
+    """ Makes loaded posts reflect the likes still waiting in the buffer. """
+    buffer = get_like_buffer()
+    if buffer is not None:
+        buffer.merge_pending(posts, viewer)
@@ -0,0 +1,202 @@
+import datetime
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from network import urls
+from network.models import User, Post, Hashtag
+from .benchmark_async import summarize
+
+
+# routes not benchmarked: they end the session
+SKIPPED = {'logout'}
+
+
+def get_routes(sample):
+    """
+    Returns {url name: (method, function returning (url, body))} for every route
+    of network/urls.py, with ids drawn from sample.
+    """
+    def get(url_name, **kwargs):
+        return 'GET', lambda rng: (reverse(url_name, kwargs={key: rng.choice(values) for key, values in kwargs.items()}), None)
+
+    def put(url_name, key, values, field):
+        return 'PUT', lambda rng: (reverse(url_name, kwargs={key: rng.choice(values)}), {field: rng.random() < 0.5})
+
+    post_ids, user_ids, tags = sample['post_ids'], sample['user_ids'], sample['tags']
+    ids = ','.join(str(post_id) for post_id in post_ids[:10])
+    routes = {
+        'index': get('index'),
+        'following': get('following'),
+        'login': get('login'),
+        'register': get('register'),
+        'profiles': get('profiles', user_id=user_ids),
+        'search': ('GET', lambda rng: (f"{reverse('search')}?q={rng.choice(sample['words'])}", None)),
+        'tag': get('tag', name=tags),
+        'mentions': get('mentions'),
+        'slow_queries': get('slow_queries'),
+        'posts': ('GET', lambda rng: (f"{reverse('posts')}?ids={ids}", None)),
+        'post': get('post', post_id=post_ids),
+        'likers': get('likers', post_id=post_ids),
+        'feed': get('feed'),
+        'following_feed': get('following_feed'),
+        'profile_feed': get('profile_feed', user_id=user_ids),
+        'search_feed': ('GET', lambda rng: (f"{reverse('search_feed')}?q={rng.choice(sample['words'])}", None)),
+        'tag_feed': get('tag_feed', name=tags),
+        'mentions_feed': get('mentions_feed'),
+        'follow_statuses': ('GET', lambda rng: (f"{reverse('follow_statuses')}?ids={','.join(map(str, user_ids[:10]))}", None)),
+        'follow': get('follow', user_id=user_ids),
+        'async_posts': ('GET', lambda rng: (f"{reverse('async_posts')}?ids={ids}", None)),
+        'async_post': get('async_post', post_id=post_ids),
+        'async_follow_statuses': ('GET', lambda rng: (f"{reverse('async_follow_statuses')}?ids={','.join(map(str, user_ids[:10]))}", None)),
+        'async_follow': get('async_follow', user_id=user_ids),
+        'metrics': get('metrics'),
+    }
+    writes = {
+        'create_post': ('POST', lambda rng: (reverse('posts'), {'post_content': f"benchmark #{rng.choice(tags)}"})),
+        'like': put('post', 'post_id', post_ids, 'liking'),
+        'follow_toggle': put('follow', 'user_id', user_ids, 'isfollowing'),
+        'async_create_post': ('POST', lambda rng: (reverse('async_posts'), {'post_content': 'benchmark'})),
+        'async_like': put('async_post', 'post_id', post_ids, 'liking'),
+        'async_follow_toggle': put('async_follow', 'user_id', user_ids, 'isfollowing'),
+    }
+    return routes, writes
+
+
+class InProcessTransport:
+    """ Sends requests through the Django test client, measuring the app without a server. """
+
+    def __init__(self, user):
+        # server errors are counted, not raised
+        self.client = Client(raise_request_exception=False)
+        self.client.force_login(user)
+
+    def request(self, method, url, body):
+        if body is None:
+            return self.client.generic(method, url).status_code
+        return self.client.generic(method, url, json.dumps(body), content_type='application/json').status_code
+
+
+class HttpTransport:
+    """ Sends requests to a running server over HTTP, logged in with a session stored in the shared database. """
+
+    def __init__(self, user, base_url):
+        self.base_url = base_url.rstrip('/')
+        client = Client()
+        client.force_login(user)
+        session = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        # the login page hands out a CSRF token for the writes
+        with urllib.request.urlopen(self.base_url + reverse('login')) as response:
+            cookies = SimpleCookie(response.headers.get('Set-Cookie', ''))
+        csrf = cookies[settings.CSRF_COOKIE_NAME].value if settings.CSRF_COOKIE_NAME in cookies else ''
+        self.headers = {
+            'Cookie': f'{settings.SESSION_COOKIE_NAME}={session}; {settings.CSRF_COOKIE_NAME}={csrf}',
+            'X-CSRFToken': csrf,
+            'Content-Type': 'application/json',
+        }
+
+    def request(self, method, url, body):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + url, data=data, headers=self.headers, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks every route of network/urls.py with concurrent requests and writes throughput "
+        "and p50/p95/p99 latency per route as JSON. Runs in process, or against a server "
+        "given by --url that uses the same database (for the login session). "
+        "Generate data first, see generate_social_graph."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Requests per route.")
+        parser.add_argument('--concurrency', type=int, default=20, help="Requests in flight at the same time.")
+        parser.add_argument('--url', help="Base url of a running server, e.g. http://127.0.0.1:8000 (default: in process).")
+        parser.add_argument('--username', help="User to send the requests as (default: the most followed user).")
+        parser.add_argument('--routes', nargs='*', help="Only these url names.")
+        parser.add_argument('--writes', action='store_true', help="Also benchmark the write routes (changes the data).")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed of the requested ids.")
+        parser.add_argument('--output', help="JSON file to write (default: benchmark-<time>.json).")
+
+    def handle(self, *args, **options):
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+        else:
+            user = User.objects.order_by('-followers_count').first()
+        if user is None or not Post.objects.exists():
+            raise CommandError("The database needs users and posts, see generate_social_graph.")
+
+        sample = {
+            'post_ids': list(Post.objects.order_by('-id').values_list('id', flat=True)[:1000]),
+            'user_ids': list(User.objects.order_by('-followers_count').values_list('id', flat=True)[:100]),
+            'tags': list(Hashtag.objects.values_list('name', flat=True)[:100]) or ['none'],
+            'words': ['the', 'time', 'new', 'years', 'first'],
+        }
+        routes, writes = get_routes(sample)
+        self.check_coverage(routes)
+        if options['writes']:
+            routes.update(writes)
+        if options['routes']:
+            routes = {name: route for name, route in routes.items() if name in options['routes']}
+
+        started = datetime.datetime.now()
+        # the test client sends requests to host 'testserver'
+        with override_settings(ALLOWED_HOSTS=['testserver', *settings.ALLOWED_HOSTS]):
+            transport = HttpTransport(user, options['url']) if options['url'] else InProcessTransport(user)
+            results = {}
+            for name, route in routes.items():
+                results[name] = self.run_route(transport, route, options)
+                self.stdout.write(
+                    f"{name:24} {results[name]['throughput']:>8} req/s  p50 {results[name]['p50']:>8} ms  "
+                    f"p95 {results[name]['p95']:>8} ms  p99 {results[name]['p99']:>8} ms  errors {results[name]['errors']}"
+                )
+
+        report = {
+            'started': started.isoformat(timespec='seconds'),
+            'target': options['url'] or 'in-process',
+            'options': {key: options[key] for key in ('requests', 'concurrency', 'writes', 'seed')},
+            'data': {'users': User.objects.count(), 'posts': Post.objects.count()},
+            'routes': results,
+        }
+        output = options['output'] or f"benchmark-{started:%Y%m%d-%H%M%S}.json"
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}.'))
+
+    def check_coverage(self, routes):
+        """ Warns about routes of network/urls.py the benchmark does not know. """
+        missing = {pattern.name for pattern in urls.urlpatterns} - set(routes) - SKIPPED
+        if missing:
+            self.stderr.write(f"Routes without benchmark: {', '.join(sorted(missing))}")
+
+    def run_route(self, transport, route, options):
+        method, make_request = route
+        rng = random.Random(options['seed'])
+        requests = [make_request(rng) for _ in range(options['requests'])]
+
+        def send(request):
+            url, body = request
+            start = time.perf_counter()
+            status = transport.request(method, url, body)
+            return time.perf_counter() - start, status
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(send, requests))
+        return summarize(results, time.perf_counter() - start)
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from network.models import User, Post
+
+
+def summarize(results, elapsed):
+    """ Returns throughput, errors and latency percentiles (in ms) of a run of (latency, status) results. """
+    latencies = sorted(latency for latency, _ in results)
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'requests': len(latencies),
+        'errors': sum(1 for _, status in results if status >= 400),
+        'throughput': round(len(latencies) / elapsed, 1),
+        'p50': round(quantiles[49] * 1000, 2),
+        'p95': round(quantiles[94] * 1000, 2),
+        'p99': round(quantiles[98] * 1000, 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the sync (WSGI) and async (ASGI) JSON API views in process: "
+        "the sync views are driven by a pool of threads, the async ones by concurrent tasks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per route and mode.")
+        parser.add_argument('--concurrency', type=int, default=50, help="Requests in flight at the same time.")
+        parser.add_argument('--username', help="User to send the requests as (default: first user).")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first() if options['username'] else User.objects.first()
+        post = Post.objects.first()
+        if user is None or post is None:
+            raise CommandError("The database needs at least one user and one post, see generate_social_graph.")
+
+        routes = {
+            'post': ('post', {'post_id': post.id}),
+            'follow': ('follow', {'user_id': post.created_by_id}),
+        }
+        results = {}
+        # the test clients send requests to host 'testserver'
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for name, (url_name, kwargs) in routes.items():
+                results[name] = {
+                    'wsgi': self.run_sync(user, reverse(url_name, kwargs=kwargs), options),
+                    'asgi': async_to_sync(self.run_async)(user, reverse(f'async_{url_name}', kwargs=kwargs), options),
+                }
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def run_sync(self, user, url, options):
+        """ Sends the requests from a thread pool, as a threaded WSGI server would. """
+        client = Client()
+        client.force_login(user)
+
+        def request(_):
+            start = time.perf_counter()
+            response = client.get(url)
+            return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(request, range(options['requests'])))
+        return summarize(results, time.perf_counter() - start)
+
+    async def run_async(self, user, url, options):
+        """ Sends the requests as concurrent tasks on one event loop, as an ASGI server would. """
+        client = AsyncClient()
+        await client.aforce_login(user)
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def request():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(url)
+                return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[request() for _ in range(options['requests'])])
+        return summarize(results, time.perf_counter() - start)
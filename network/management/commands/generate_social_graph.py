@@ -0,0 +1,162 @@
+import itertools
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from network import search
+from network.models import User, Post, TimelineEntry, Hashtag, PostTag, Mention
+from .recount_counters import recount
+
+
+WORDS = (
+    'the a of and to in is it that for on with as was at by this be from or have an they which one you '
+    'were her all she there would their we him been has when who will more no if out so said what up its '
+    'about into than them can only other new some could time these two may then do first any my now such '
+    'like our over man me even most made after also did many before must through back years where much'
+).split()
+
+
+def power_law_weights(n, exponent):
+    """ Returns the cumulative weights of n items, the item of rank r with weight 1 / r ** exponent. """
+    return list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, n + 1)))
+
+
+def power_law_sampler(population, exponent, rng):
+    """ Returns a function making k power-law draws from population and returning the distinct items drawn. """
+    cum_weights = power_law_weights(len(population), exponent)
+
+    def sample(k):
+        return set(rng.choices(population, cum_weights=cum_weights, k=k))
+    return sample
+
+
+def heavy_tailed(mean, rng):
+    """ Returns a Pareto distributed count with the given mean. """
+    # Pareto with shape 2 has mean 2 * scale
+    return int(rng.paretovariate(2) * mean / 2)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a synthetic social graph for benchmarks: users, posts with hashtags and mentions, "
+        "and power-law distributed follows and likes, inserted in bulk. "
+        "Timelines, counters and the search index are rebuilt afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help="Number of users.")
+        parser.add_argument('--posts', type=int, default=20000, help="Number of posts.")
+        parser.add_argument('--follows', type=int, default=50, help="Mean number of people a user follows.")
+        parser.add_argument('--likes', type=int, default=10, help="Mean number of likes of a post.")
+        parser.add_argument('--exponent', type=float, default=1.1, help="Power-law exponent of popularity.")
+        parser.add_argument('--tags', type=int, default=200, help="Number of distinct hashtags.")
+        parser.add_argument('--prefix', default='user', help="Usernames are <prefix><n>.")
+        parser.add_argument('--password', default='password', help="Password of every generated user.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, runs with the same seed are identical.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per INSERT.")
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username=f"{options['prefix']}0").exists():
+            raise CommandError(f"Users named {options['prefix']}<n> exist already, choose another --prefix.")
+        rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        with transaction.atomic():
+            user_ids = self.step('users', self.create_users, options)
+            self.step('follows', self.create_follows, user_ids, rng, options)
+            posts = self.step('posts', self.create_posts, user_ids, rng, options)
+            self.step('likes', self.create_likes, posts, user_ids, rng, options)
+            self.step('timelines', self.build_timelines, user_ids)
+            self.step('counters', recount)
+        if search.is_enabled():
+            with transaction.atomic():
+                self.step('search index', search.rebuild_index)
+
+    def step(self, name, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.stdout.write(f'{name}: {time.perf_counter() - start:.1f}s')
+        return result
+
+    def create_users(self, options):
+        # hashing is slow by design, every user gets the same hash
+        password = make_password(options['password'])
+        users = User.objects.bulk_create(
+            [User(username=f"{options['prefix']}{i}", password=password) for i in range(options['users'])],
+            batch_size=self.batch_size
+        )
+        return [user.id for user in users]
+
+    def create_follows(self, user_ids, rng, options):
+        """ Every user follows a heavy-tailed number of users, popular users are followed more often. """
+        Follow = User.followed_by.through
+        popular = power_law_sampler(user_ids, options['exponent'], rng)
+        follows = []
+        for follower_id in user_ids:
+            for followed_id in popular(heavy_tailed(options['follows'], rng)):
+                if followed_id != follower_id:
+                    follows.append(Follow(from_user_id=followed_id, to_user_id=follower_id))
+        Follow.objects.bulk_create(follows, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def create_posts(self, user_ids, rng, options):
+        """
+        Active users post more, some posts carry #hashtags (power law again) and
+        @mentions. Activity is ranked independently of popularity, else the most
+        followed users write most posts and the timelines explode.
+        """
+        usernames = {user_id: f"{options['prefix']}{i}" for i, user_id in enumerate(user_ids)}
+        tag_names = [f'tag{i}' for i in range(options['tags'])]
+        by_activity = rng.sample(user_ids, len(user_ids))
+        authors = rng.choices(by_activity, cum_weights=power_law_weights(len(user_ids), options['exponent']), k=options['posts'])
+        popular_tags = power_law_sampler(tag_names, options['exponent'], rng)
+
+        posts, post_tags, post_mentions = [], [], []
+        for author_id in authors:
+            words = rng.choices(WORDS, k=rng.randint(5, 40))
+            tags = popular_tags(rng.choice((0, 0, 1, 2))) if tag_names else set()
+            mentions = {rng.choice(user_ids) for _ in range(rng.choice((0, 0, 0, 1)))}
+            words += [f'#{tag}' for tag in tags] + [f'@{usernames[user_id]}' for user_id in mentions]
+            posts.append(Post(created_by_id=author_id, content=' '.join(words)))
+            post_tags.append(tags)
+            post_mentions.append(mentions)
+        posts = Post.objects.bulk_create(posts, batch_size=self.batch_size)
+
+        # store the tags and mentions written into the posts, as Post.update_tags() would
+        Hashtag.objects.bulk_create([Hashtag(name=name) for name in tag_names], ignore_conflicts=True)
+        tag_ids = dict(Hashtag.objects.filter(name__in=tag_names).values_list('name', 'id'))
+        PostTag.objects.bulk_create(
+            [PostTag(post=post, tag_id=tag_ids[name], created_time=post.created_time) for post, names in zip(posts, post_tags) for name in names],
+            batch_size=self.batch_size
+        )
+        Mention.objects.bulk_create(
+            [Mention(post=post, user_id=user_id, created_time=post.created_time) for post, mentioned in zip(posts, post_mentions) for user_id in mentioned],
+            batch_size=self.batch_size
+        )
+        return posts
+
+    def create_likes(self, posts, user_ids, rng, options):
+        """ Every post gets a heavy-tailed number of likes, popular users like more. """
+        Like = Post.liked_by.through
+        likers = power_law_sampler(user_ids, options['exponent'], rng)
+        Like.objects.bulk_create(
+            [Like(post_id=post.id, user_id=user_id) for post in posts for user_id in likers(heavy_tailed(options['likes'], rng))],
+            batch_size=self.batch_size,
+            ignore_conflicts=True
+        )
+
+    def build_timelines(self, user_ids):
+        """ Materializes the timelines of the generated users in one INSERT ... SELECT. """
+        Follow = User.followed_by.through
+        # the generated users got the highest ids
+        follows = Follow.objects.filter(to_user_id__gte=min(user_ids))
+        sql, params = follows.values_list('to_user_id', 'from_user_id').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {TimelineEntry._meta.db_table} (user_id, post_id, created_time) '
+                f'SELECT f.to_user_id, p.id, p.created_time FROM ({sql}) f '
+                f'JOIN {Post._meta.db_table} p ON p.created_by_id = f.from_user_id',
+                params
+            )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from network import thumbnails
+from network.models import User
+
+
+class Command(BaseCommand):
+    help = "Renders the missing thumbnails of user images, e.g. of images uploaded before thumbnails existed."
+
+    def handle(self, *args, **options):
+        count = 0
+        for user in User.objects.exclude(image='').exclude(image=None).only('id', 'image').iterator():
+            if not thumbnails.has_variants(user.image):
+                thumbnails.make_variants(user.image)
+                count += 1
+        self.stdout.write(self.style.SUCCESS(f'Thumbnails rendered for {count} images.'))
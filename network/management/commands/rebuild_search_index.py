@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from network import search
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index of post content from the posts table."
+
+    def handle(self, *args, **options):
+        if not search.is_enabled():
+            raise CommandError('Full-text search requires SQLite.')
+        with transaction.atomic():
+            count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'{count} posts indexed.'))
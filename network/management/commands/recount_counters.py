@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from network.models import User, Post, count_of
+
+
+def recount():
+    """ Recomputes all denormalized counters from the relation tables. """
+    Follow = User.followed_by.through
+    Like = Post.liked_by.through
+    with transaction.atomic():
+        User.objects.update(
+            posts_count=count_of(Post.objects.all(), 'created_by'),
+            followers_count=count_of(Follow.objects.all(), 'from_user'),
+            following_count=count_of(Follow.objects.all(), 'to_user'),
+        )
+        Post.objects.update(likes_count=count_of(Like.objects.all(), 'post'))
+
+
+class Command(BaseCommand):
+    help = "Recomputes the stored like, post, follower and following counters from scratch."
+
+    def handle(self, *args, **options):
+        recount()
+        self.stdout.write(self.style.SUCCESS('Counters recomputed.'))
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from network import slowlog
+
+
+class Command(BaseCommand):
+    help = (
+        "Shows the slow query log with the query plans, slowest first. "
+        "Sees the queries of the server processes only if SLOW_QUERY_DIR is set."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20, help="Show at most this many queries.")
+        parser.add_argument('--clear', action='store_true', help="Empty the log instead.")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            slowlog.clear_slow_queries()
+            self.stdout.write(self.style.SUCCESS('Slow query log cleared.'))
+            return
+        if not getattr(settings, 'SLOW_QUERY_DIR', None):
+            self.stderr.write("SLOW_QUERY_DIR is not set, the queries of the server processes are not visible.")
+
+        slow_queries = slowlog.get_slow_queries()
+        for query in slow_queries[:options['limit']]:
+            self.stdout.write(self.style.WARNING(f"{query['duration_ms']} ms  {query['view'] or 'no view'}  {query['caller']}"))
+            self.stdout.write(f"  at {query['time']} on {query['database']}")
+            self.stdout.write(f"  {query['sql']}")
+            self.stdout.write(f"  parameters: {query['params']}")
+            for line in query['plan']:
+                self.stdout.write(f"  plan: {line}")
+            self.stdout.write('')
+        self.stdout.write(f"{len(slow_queries)} slow queries.")
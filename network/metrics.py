@@ -0,0 +1,144 @@
+"""
+In-process metrics in the Prometheus text format, served at /metrics.
+
+MetricsMiddleware counts every request and observes its latency and number
+of queries per url name, the models count likes, follows and new posts once
+they are committed. Each process keeps its own registry. With METRICS_DIR
+set, every process also writes its registry to <METRICS_DIR>/<pid>.json at
+most every METRICS_FLUSH_SECONDS and at exit, and /metrics adds up the files
+of all processes, so it reports the same totals whichever worker serves it.
+Empty METRICS_DIR when the server (re)starts.
+"""
+import atexit
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from . import pidfiles
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# name -> (type, help, buckets of histograms)
+METRICS = {
+    'http_requests_total': ('counter', 'Requests by url name, method and status.', None),
+    'http_request_duration_seconds': ('histogram', 'Request latency by url name.', LATENCY_BUCKETS),
+    'http_request_queries': ('histogram', 'Database queries per request by url name.', QUERY_BUCKETS),
+    'network_posts_created_total': ('counter', 'Posts created.', None),
+    'network_likes_total': ('counter', 'Likes added.', None),
+    'network_unlikes_total': ('counter', 'Likes removed.', None),
+    'network_follows_total': ('counter', 'Follows added.', None),
+    'network_unfollows_total': ('counter', 'Follows removed.', None),
+}
+
+
+class Registry:
+    """ Counters and histograms of one process, keyed by metric name and label values. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, ((label, value), ...)) -> count
+        self.counters = {}
+        # (name, ((label, value), ...)) -> [count of every bucket and +Inf, sum]
+        self.histograms = {}
+        self.flushed = 0
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = METRICS[name][2]
+        with self.lock:
+            histogram = self.histograms.setdefault(key, [0] * (len(buckets) + 2))
+            # not cumulative here, the text format adds the buckets up
+            histogram[bisect.bisect_left(buckets, value)] += 1
+            histogram[-1] += value
+
+    def snapshot(self):
+        """ Returns the registry as JSON serializable lists. """
+        with self.lock:
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, dict(labels), list(values)] for (name, labels), values in self.histograms.items()],
+            }
+
+    def flush(self, force=False):
+        """ Writes the snapshot to the file of this process, if METRICS_DIR is set and the last write is old enough. """
+        if not getattr(settings, 'METRICS_DIR', None):
+            return
+        now = time.monotonic()
+        if not force and now - self.flushed < getattr(settings, 'METRICS_FLUSH_SECONDS', 5):
+            return
+        self.flushed = now
+        pidfiles.write_process_file(settings.METRICS_DIR, self.snapshot())
+
+
+def merge(snapshots):
+    """ Adds up snapshots of several processes into one. """
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(sorted(labels.items())))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(sorted(labels.items())))
+            histograms[key] = [a + b for a, b in zip(histograms.get(key, [0] * len(values)), values)]
+    return counters, histograms
+
+
+def format_labels(labels, **extra):
+    labels = [*labels, *extra.items()]
+    if not labels:
+        return ''
+    values = [f'{name}="{escape(value)}"' for name, value in labels]
+    return '{' + ','.join(values) + '}'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render(counters, histograms):
+    """ Returns merged counters and histograms in the Prometheus text format. """
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+        else:
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                total = 0
+                for bound, count in zip([*buckets, '+Inf'], values):
+                    total += count
+                    lines.append(f'{name}_bucket{format_labels(labels, le=bound)} {total}')
+                lines.append(f'{name}_sum{format_labels(labels)} {values[-1]}')
+                lines.append(f'{name}_count{format_labels(labels)} {total}')
+    return '\n'.join(lines) + '\n'
+
+
+def collect():
+    """ Returns the metrics of all processes, or of this one without METRICS_DIR, in the text format. """
+    if not getattr(settings, 'METRICS_DIR', None):
+        return render(*merge([registry.snapshot()]))
+    registry.flush(force=True)
+    return render(*merge(pidfiles.read_process_files(settings.METRICS_DIR)))
+
+
+def count_on_commit(name, amount=1):
+    """ Increments counter name once the current transaction commits. """
+    transaction.on_commit(lambda: registry.inc(name, amount))
+
+
+registry = Registry()
+atexit.register(lambda: registry.flush(force=True))
@@ -0,0 +1,187 @@
+import json
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics
+from .profiling import Profile, current_profile, logger as profile_logger
+from .routers import primary_pinned
+
+
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaPinningMiddleware:
+    """
+    Pins requests that write, and requests of clients that wrote recently, to
+    the primary database. The pin is remembered in a short lived cookie.
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = primary_pinned.set(self.is_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            primary_pinned.reset(token)
+        return self.remember_write(request, response)
+
+    async def __acall__(self, request):
+        token = primary_pinned.set(self.is_pinned(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            primary_pinned.reset(token)
+        return self.remember_write(request, response)
+
+    def is_pinned(self, request):
+        return request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+
+    def remember_write(self, request, response):
+        seconds = getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 0)
+        if request.method not in SAFE_METHODS and seconds:
+            response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a sample of PROFILING_SAMPLE_RATE of the requests: query count,
+    SQL time, template render time and the rest of the time in Python. The
+    numbers go to the Server-Timing header of the response and to one JSON
+    log line of the network.profiling logger. Put it first in MIDDLEWARE to
+    measure the whole request.
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.is_sampled():
+            return self.get_response(request)
+        profile = Profile()
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.report(request, response, profile, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self.is_sampled():
+            return await self.get_response(request)
+        profile = Profile()
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.report(request, response, profile, time.perf_counter() - start)
+
+    def is_sampled(self):
+        rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        return rate > 0 and random.random() < rate
+
+    def report(self, request, response, profile, total_seconds):
+        sql_ms = profile.sql_seconds * 1000
+        template_ms = profile.template_seconds * 1000
+        total_ms = total_seconds * 1000
+        python_ms = max(total_ms - sql_ms - template_ms, 0)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={sql_ms:.2f};desc="{profile.queries} queries"',
+            f'tpl;dur={template_ms:.2f};desc="Templates"',
+            f'app;dur={python_ms:.2f};desc="Python"',
+            f'total;dur={total_ms:.2f}',
+        ])
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'url_name': request.resolver_match.url_name if request.resolver_match else None,
+            'status': response.status_code,
+            'queries': profile.queries,
+            'sql_ms': round(sql_ms, 2),
+            'template_ms': round(template_ms, 2),
+            'python_ms': round(python_ms, 2),
+            'total_ms': round(total_ms, 2),
+        }
+        profile_logger.info(json.dumps(record), extra={'profile': record})
+        return response
+
+
+class MetricsMiddleware:
+    """ Records count, latency and number of queries of every request by url name, see network/metrics.py. """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile, token = self.start_profile()
+        queries = profile.queries
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            if token is not None:
+                current_profile.reset(token)
+        return self.record(request, response, profile.queries - queries, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        profile, token = self.start_profile()
+        queries = profile.queries
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            if token is not None:
+                current_profile.reset(token)
+        return self.record(request, response, profile.queries - queries, time.perf_counter() - start)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # name the view for the slow query log
+        current_profile.get().view = f'{view_func.__module__}.{view_func.__name__}'
+
+    def start_profile(self):
+        """ Returns the profile counting the queries of the request, shared with ProfilingMiddleware if it samples the request. """
+        profile = current_profile.get()
+        if profile is not None:
+            return profile, None
+        profile = Profile()
+        return profile, current_profile.set(profile)
+
+    def record(self, request, response, queries, seconds):
+        # unmatched urls get one label, so scanners can not create unbounded series
+        url_name = request.resolver_match.url_name if request.resolver_match else 'unmatched'
+        metrics.registry.inc('http_requests_total', url_name=url_name, method=request.method, status=response.status_code)
+        metrics.registry.observe('http_request_duration_seconds', seconds, url_name=url_name)
+        metrics.registry.observe('http_request_queries', queries, url_name=url_name)
+        metrics.registry.flush()
+        return response
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_timelines(apps, schema_editor):
+    """ Materializes the timelines of existing follows. """
+    User = apps.get_model('network', 'User')
+    Post = apps.get_model('network', 'Post')
+    TimelineEntry = apps.get_model('network', 'TimelineEntry')
+    Follow = User.followed_by.through
+
+    for follow in Follow.objects.all():
+        posts = Post.objects.filter(created_by_id=follow.from_user_id).values_list('id', 'created_time')
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=follow.to_user_id, post_id=post_id, created_time=created_time) for post_id, created_time in posts],
+            ignore_conflicts=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0002_user_followed_by_user_image_post'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_time', models.DateTimeField(null=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='network.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_time', '-post'], name='timeline_user_time_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'post'), name='unique_timeline_entry')],
+            },
+        ),
+        migrations.RunPython(build_timelines, migrations.RunPython.noop),
+    ]
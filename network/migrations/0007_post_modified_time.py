@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:38
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_modified_time(apps, schema_editor):
+    """ Existing posts were last modified when they were created, as far as we know. """
+    Post = apps.get_model('network', 'Post')
+    Post.objects.update(modified_time=F('created_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0006_post_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='modified_time',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.RunPython(fill_modified_time, migrations.RunPython.noop),
+    ]
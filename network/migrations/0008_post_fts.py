@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:02
+
+from django.db import migrations
+
+
+def create_fts_table(apps, schema_editor):
+    """ Creates and fills the full-text index of post content, SQLite only. """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('CREATE VIRTUAL TABLE network_post_fts USING fts5(content)')
+    schema_editor.execute('INSERT INTO network_post_fts (rowid, content) SELECT id, content FROM network_post')
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE network_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0007_post_modified_time'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:50
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def index_existing_posts(apps, schema_editor):
+    """ Extracts the #hashtags and @mentions of existing posts (same patterns as network.models). """
+    User = apps.get_model('network', 'User')
+    Post = apps.get_model('network', 'Post')
+    Hashtag = apps.get_model('network', 'Hashtag')
+    PostTag = apps.get_model('network', 'PostTag')
+    Mention = apps.get_model('network', 'Mention')
+    hashtag_re = re.compile(r'(?<![\w#&/])#(\w{1,100})(?!\w)')
+    mention_re = re.compile(r'(?<![\w@])@([\w.@+-]*\w)')
+
+    user_ids = dict(User.objects.values_list('username', 'id'))
+    for post in Post.objects.filter(content__regex=r'[#@]').only('id', 'content', 'created_time').iterator():
+        for name in {name.lower() for name in hashtag_re.findall(post.content)}:
+            tag, _ = Hashtag.objects.get_or_create(name=name)
+            PostTag.objects.get_or_create(post_id=post.id, tag=tag, defaults={'created_time': post.created_time})
+        for username in set(mention_re.findall(post.content)):
+            if username in user_ids:
+                Mention.objects.get_or_create(
+                    post_id=post.id, user_id=user_ids[username], defaults={'created_time': post.created_time}
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0008_post_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hashtag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Mention',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_time', models.DateTimeField(null=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to='network.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_time', '-post'], name='mention_user_time_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'post'), name='unique_mention')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PostTag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_time', models.DateTimeField(null=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='post_tags', to='network.post')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='post_tags', to='network.hashtag')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tag', '-created_time', '-post'], name='posttag_tag_time_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tag', 'post'), name='unique_post_tag')],
+            },
+        ),
+        migrations.RunPython(index_existing_posts, migrations.RunPython.noop),
+    ]
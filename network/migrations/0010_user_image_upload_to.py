@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:32
+
+import network.thumbnails
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0009_hashtags_mentions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='image',
+            field=models.ImageField(null=True, upload_to=network.thumbnails.upload_to),
+        ),
+    ]
@@ -1,32 +1,100 @@
+import re
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models import BooleanField, Count, Exists, F, FloatField, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import metrics, search, thumbnails
+
+
+# #hashtags (up to 100 characters, longer words are no tag) and @mentions, not counting the middle of words,
+# e-mail addresses or urls with fragments
+HASHTAG_RE = re.compile(r'(?<![\w#&/])#(\w{1,100})(?!\w)')
+MENTION_RE = re.compile(r'(?<![\w@])@([\w.@+-]*\w)')
+
+
+def count_of(queryset, field):
+    """ Returns a subquery counting the rows of queryset that point to the outer row through field. """
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(count=Count('*')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
 
 
 class User(AbstractUser):
     followed_by = models.ManyToManyField('self', blank=True, related_name='following', symmetrical=False)
-    image = models.ImageField(upload_to='images/', null=True)
+    image = models.ImageField(upload_to=thumbnails.upload_to, null=True)
+    # denormalized counters, see the recount_counters command
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
 
     def is_following(self, another_user):
         """ Returns True if this user is following another_user. """
-        return another_user in self.following.all()
+        return User.followed_by.through.objects.filter(from_user=another_user, to_user=self).exists()
+
+    def followed_ids_of(self, user_ids):
+        """ Returns a queryset of the ids in user_ids followed by this user, for the sync and async lookups below. """
+        return User.followed_by.through.objects.filter(to_user=self, from_user__in=user_ids).values_list('from_user', flat=True)
+
+    def get_followed_ids(self, user_ids):
+        """ Returns the subset of user_ids followed by this user, in one query. """
+        return set(self.followed_ids_of(user_ids))
+
+    async def aget_followed_ids(self, user_ids):
+        return {followed_id async for followed_id in self.followed_ids_of(user_ids)}
 
     def follow(self, another_user):
         """ Makes this user follow another_user. """
-        # if not yet following but instructed to follow
-        if not self.is_following(another_user):
-            another_user.followed_by.add(self)
-            another_user.save()
+        # insert into the through table, counters and timeline change only if the row is new
+        with transaction.atomic():
+            _, created = User.followed_by.through.objects.get_or_create(from_user=another_user, to_user=self)
+            if created:
+                metrics.count_on_commit('network_follows_total')
+                User.objects.filter(pk=another_user.pk).update(followers_count=F('followers_count') + 1)
+                User.objects.filter(pk=self.pk).update(following_count=F('following_count') + 1)
+                TimelineEntry.backfill(self, another_user)
 
     def unfollow(self, another_user):
         """ Makes this user unfollow another_user. """
-        # if not yet following but instructed to follow
-        if self.is_following(another_user):
-            another_user.followed_by.remove(self)
-            another_user.save()
+        # delete from the through table, counters and timeline change only if a row was deleted
+        with transaction.atomic():
+            deleted, _ = User.followed_by.through.objects.filter(from_user=another_user, to_user=self).delete()
+            if deleted:
+                metrics.count_on_commit('network_unfollows_total')
+                User.objects.filter(pk=another_user.pk, followers_count__gt=0).update(followers_count=F('followers_count') - 1)
+                User.objects.filter(pk=self.pk, following_count__gt=0).update(following_count=F('following_count') - 1)
+                TimelineEntry.prune(self, another_user)
 
     def get_posts_of_followed_people(self):
         """ Returns posts posted by people followed by this user, in reversed order. """
-        return Post.objects.filter(created_by__in=self.following.all()).order_by('-created_time')
+        # read the materialized timeline instead of joining the whole post table
+        return Post.objects.filter(timeline_entries__user=self).order_by(
+            '-timeline_entries__created_time', '-timeline_entries__post'
+        )
+
+    def get_posts_mentioning(self):
+        """ Returns posts mentioning this user, in reversed order. """
+        return Post.objects.filter(mentions__user=self).order_by('-mentions__created_time', '-mentions__post')
+
+class PostQuerySet(models.QuerySet):
+
+    def feed(self, viewer=None):
+        """ Returns posts ready to be listed: creators joined and like state of viewer annotated. """
+        posts = self.select_related('created_by')
+        if viewer is None or not viewer.is_authenticated:
+            return posts.annotate(liked_by_viewer=Value(False, output_field=BooleanField()))
+        return posts.annotate(liked_by_viewer=Exists(
+            Post.liked_by.through.objects.filter(post=OuterRef('pk'), user=viewer)
+        ))
+
+    def search(self, text):
+        """ Returns posts containing every word of text, annotated with their relevance as search_rank. """
+        match_query = search.to_match_query(text)
+        if not match_query or not search.is_enabled():
+            return self.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+        return self.filter(id__in=search.matching_ids(match_query)).annotate(search_rank=search.score(match_query))
+
 
 class Post(models.Model):
     """ Class to represent a post. """
@@ -34,20 +102,181 @@ class Post(models.Model):
     created_time = models.DateTimeField(auto_now_add=True, null=True)
     content = models.TextField()
     liked_by = models.ManyToManyField(User, blank=True, related_name='liked_posts')
+    # denormalized counter, see the recount_counters command
+    likes_count = models.PositiveIntegerField(default=0)
+    # bumped on every change, keys the cached rendering of the post
+    version = models.PositiveIntegerField(default=1)
+    modified_time = models.DateTimeField(auto_now=True, null=True)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # feeds are read newest first, seeking on (created_time, id)
+            models.Index(fields=['-created_time', '-id'], name='post_time_idx'),
+            models.Index(fields=['created_by', '-created_time', '-id'], name='post_creator_time_idx'),
+        ]
 
     def __str__(self):
         return f'{self.id}: {self.created_by} - {self.content[:50]}'
 
     def serialize(self):
+        """ Returns post as a dict, liked_by_me is set for posts loaded by Post.objects.feed(viewer). """
         return {
             "id": self.id,
             "created_by": self.created_by.id,
             "created_time": self.created_time.strftime("%b %d %Y, %I:%M %p"), #[user.email for user in self.recipients.all()]
             "content": self.content,
-            "liked_by": [user.id for user in self.liked_by.all()]
+            "likes": self.likes_count,
+            "liked_by_me": getattr(self, 'liked_by_viewer', False)
         }
 
+    def edit(self, content):
+        """ Replaces content of this post. """
+        self.content = content
+        Post.objects.filter(pk=self.pk).update(
+            content=content, version=F('version') + 1, modified_time=timezone.now()
+        )
+        search.index_post(self)
+        self.update_tags()
+
+    def update_tags(self, replace=True):
+        """ Stores the #hashtags and @mentions of the content, replace drops the ones no longer there. """
+        names = {name.lower() for name in HASHTAG_RE.findall(self.content)}
+        usernames = set(MENTION_RE.findall(self.content))
+        if replace:
+            PostTag.objects.filter(post=self).exclude(tag__name__in=names).delete()
+            Mention.objects.filter(post=self).exclude(user__username__in=usernames).delete()
+
+        if names:
+            Hashtag.objects.bulk_create([Hashtag(name=name) for name in names], ignore_conflicts=True)
+            PostTag.objects.bulk_create(
+                [PostTag(post=self, tag=tag, created_time=self.created_time) for tag in Hashtag.objects.filter(name__in=names)],
+                ignore_conflicts=True
+            )
+        if usernames:
+            Mention.objects.bulk_create(
+                [Mention(post=self, user=user, created_time=self.created_time) for user in User.objects.filter(username__in=usernames)],
+                ignore_conflicts=True
+            )
+
+    def like(self, user):
+        """ Adds like of user to this post. Returns True if the post was not liked by user yet. """
+        with transaction.atomic():
+            _, created = Post.liked_by.through.objects.get_or_create(post=self, user=user)
+            if created:
+                metrics.count_on_commit('network_likes_total')
+                Post.objects.filter(pk=self.pk).update(
+                    likes_count=F('likes_count') + 1, version=F('version') + 1, modified_time=timezone.now()
+                )
+        return created
+
+    def unlike(self, user):
+        """ Removes like of user from this post. Returns True if the post was liked by user. """
+        with transaction.atomic():
+            deleted, _ = Post.liked_by.through.objects.filter(post=self, user=user).delete()
+            if deleted:
+                metrics.count_on_commit('network_unlikes_total')
+                Post.objects.filter(pk=self.pk, likes_count__gt=0).update(
+                    likes_count=F('likes_count') - 1, version=F('version') + 1, modified_time=timezone.now()
+                )
+        return bool(deleted)
+
     @staticmethod
     def get_all_posts():
         """ Returns all posts in reverse order """
-        return Post.objects.all().order_by('-created_time')
\ No newline at end of file
+        return Post.objects.all().order_by('-created_time')
+
+
+class TimelineEntry(models.Model):
+    """ Class to represent a post materialized into the home timeline of a follower. """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    # copy of post.created_time so the timeline can be read from one index
+    created_time = models.DateTimeField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created_time', '-post'], name='timeline_user_time_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.post_id}'
+
+    @staticmethod
+    def fan_out(post):
+        """ Adds a new post to the timeline of every follower of its creator. """
+        if post.created_by_id is None:
+            return
+        follower_ids = post.created_by.followed_by.values_list('id', flat=True)
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=follower_id, post=post, created_time=post.created_time) for follower_id in follower_ids],
+            ignore_conflicts=True
+        )
+
+    @staticmethod
+    def backfill(user, followed_user):
+        """ Adds all posts of followed_user to the timeline of user. """
+        posts = Post.objects.filter(created_by=followed_user).values_list('id', 'created_time')
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user=user, post_id=post_id, created_time=created_time) for post_id, created_time in posts],
+            ignore_conflicts=True
+        )
+
+    @staticmethod
+    def prune(user, followed_user):
+        """ Removes all posts of followed_user from the timeline of user. """
+        TimelineEntry.objects.filter(user=user, post__created_by=followed_user).delete()
+
+
+class Hashtag(models.Model):
+    """ Class to represent a #hashtag, stored in lower case. """
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return f'#{self.name}'
+
+    def get_posts(self):
+        """ Returns posts tagged with this hashtag, in reversed order. """
+        return Post.objects.filter(post_tags__tag=self).order_by('-post_tags__created_time', '-post_tags__post')
+
+
+class PostTag(models.Model):
+    """ Class to represent a hashtag used in a post. """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='post_tags')
+    tag = models.ForeignKey(Hashtag, on_delete=models.CASCADE, related_name='post_tags')
+    # copy of post.created_time so the posts of a tag can be read from one index
+    created_time = models.DateTimeField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tag', 'post'], name='unique_post_tag'),
+        ]
+        indexes = [
+            models.Index(fields=['tag', '-created_time', '-post'], name='posttag_tag_time_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.tag} - {self.post_id}'
+
+
+class Mention(models.Model):
+    """ Class to represent an @mention of a user in a post. """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='mentions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='mentions')
+    # copy of post.created_time so the mentions of a user can be read from one index
+    created_time = models.DateTimeField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'], name='unique_mention'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created_time', '-post'], name='mention_user_time_idx'),
+        ]
+
+    def __str__(self):
+        return f'@{self.user} - {self.post_id}'
@@ -0,0 +1,147 @@
+import base64
+import datetime
+import json
+import math
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import F, Q
+
+
+class CursorPage:
+    """ Class to represent one page of a keyset paginated queryset. """
+
+    is_cursor_page = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class CursorPaginator:
+    """
+    Paginates a queryset by seeking on a tuple of keys in descending order,
+    e.g. (created_time, id), instead of counting and skipping rows.
+    Keys may span relations, the last key must be unique.
+    """
+
+    def __init__(self, object_list, per_page, keys=('created_time', 'id')):
+        self.per_page = per_page
+        self.aliases = [f'cursor_key_{i}' for i in range(len(keys))]
+        self.object_list = object_list.annotate(
+            **{alias: F(key) for alias, key in zip(self.aliases, keys)}
+        )
+
+    def get_page(self, cursor=None):
+        """ Returns the page the cursor points to, or the first page if the cursor is missing or invalid. """
+        direction, values = decode_cursor(cursor, len(self.aliases))
+
+        # fetch one extra row to find out whether there is a further page
+        queryset = self.object_list
+        try:
+            if direction == 'previous':
+                queryset = queryset.filter(self._seek(values, 'gt')).order_by(*self.aliases)
+            else:
+                if values is not None:
+                    queryset = queryset.filter(self._seek(values, 'lt'))
+                queryset = queryset.order_by(*[f'-{alias}' for alias in self.aliases])
+        except (ValidationError, ValueError, TypeError):
+            # key values of a tampered token do not fit the fields
+            return self.get_page()
+        rows = list(queryset[:self.per_page + 1])
+
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'previous':
+            rows.reverse()
+
+        # a page reached from a cursor always has a neighbour in the opposite direction
+        has_next = has_more if direction != 'previous' else True
+        has_previous = has_more if direction == 'previous' else values is not None
+        next_cursor = encode_cursor('next', self._values(rows[-1])) if rows and has_next else None
+        previous_cursor = encode_cursor('previous', self._values(rows[0])) if rows and has_previous else None
+        return CursorPage(rows, next_cursor, previous_cursor)
+
+    def _values(self, obj):
+        return [getattr(obj, alias) for alias in self.aliases]
+
+    def _seek(self, values, lookup):
+        """ Builds the row comparison (k0, k1, ...) < or > (v0, v1, ...) as a Q object. """
+        condition = Q()
+        for i in reversed(range(len(values))):
+            strict = Q(**{f'{self.aliases[i]}__{lookup}': values[i]})
+            if i == len(values) - 1:
+                condition = strict
+            else:
+                condition = strict | (Q(**{self.aliases[i]: values[i]}) & condition)
+        return condition
+
+
+class CursorEncoder(json.JSONEncoder):
+    """ Encodes datetimes with full precision, as keys must round-trip exactly. """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(direction, values):
+    """ Returns an opaque token for the given direction and key values. """
+    data = json.dumps({'d': direction, 'k': values}, cls=CursorEncoder)
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, key_count):
+    """ Returns (direction, values) decoded from a token, or (None, None) if it is not valid. """
+    if not cursor:
+        return None, None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)), parse_constant=reject_constant)
+        direction, values = data['d'], data['k']
+    except (ValueError, TypeError, KeyError):
+        return None, None
+    if direction not in ('next', 'previous') or not isinstance(values, list) or len(values) != key_count:
+        return None, None
+    if not all(is_valid_key(value) for value in values):
+        return None, None
+    return direction, values
+
+
+def reject_constant(name):
+    raise ValueError(f'{name} is not a valid key')
+
+
+def is_valid_key(value):
+    """ Returns whether a decoded key value can be a query parameter, e.g. 1e400 is infinite and 2**64 overflows. """
+    if isinstance(value, float):
+        return math.isfinite(value)
+    if isinstance(value, int):
+        return -2**63 <= value < 2**63
+    return True
+
+
+def paginate(request, object_list, per_page=10, keys=('created_time', 'id')):
+    """
+    Returns the requested page of object_list. Legacy ?page=N links are served
+    by the numbered paginator, everything else by the cursor paginator.
+    """
+    if 'page' in request.GET:
+        return Paginator(object_list, per_page).get_page(request.GET.get('page'))
+    return CursorPaginator(object_list, per_page, keys).get_page(request.GET.get('cursor'))
@@ -0,0 +1,45 @@
+"""
+JSON files of the server processes, one per process.
+
+metrics.py and slowlog.py keep their data in the memory of each process.
+With their directory set, every process also writes it to
+<directory>/<pid>.json, and readers load the files of all processes, so
+they see the same data whichever worker serves them.
+"""
+import glob
+import json
+import os
+
+
+def write_json(path, data):
+    # write and rename, readers never see half a file
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def write_process_file(directory, data):
+    """ Writes data to the file of this process in directory. """
+    os.makedirs(directory, exist_ok=True)
+    write_json(os.path.join(directory, f'{os.getpid()}.json'), data)
+
+
+def read_process_files(directory):
+    """ Returns the data of the files of all processes in directory. """
+    files = []
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            with open(path) as f:
+                files.append(json.load(f))
+        except (OSError, ValueError):
+            # a process wrote its first file while we listed the directory
+            continue
+    return files
+
+
+def remove_process_files(directory):
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
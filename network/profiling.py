@@ -0,0 +1,83 @@
+"""
+Per-request profiling for ProfilingMiddleware.
+
+While a request is profiled, current_profile holds its Profile. Every
+database connection gets an execute wrapper that adds queries and SQL time
+to it, and the template backend below adds the time spent rendering
+templates, minus the SQL run from inside the templates. The context
+variable follows the request into sync_to_async threads, so async views are
+measured too. Writes run on the writer thread of WRITE_QUEUE are not.
+"""
+import logging
+import time
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates, Template as DjangoTemplate
+
+
+logger = logging.getLogger(__name__)
+
+# the Profile of the current request, set by ProfilingMiddleware when it samples and by MetricsMiddleware
+current_profile = ContextVar('current_profile', default=None)
+
+
+class Profile:
+    """ Query count, SQL time and template render time of one request, and its view. """
+
+    def __init__(self):
+        self.view = None
+        self.queries = 0
+        self.sql_seconds = 0
+        self.template_seconds = 0
+
+
+def time_query(execute, sql, params, many, context):
+    """ Execute wrapper adding the query to the profile of the current request. """
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries += 1
+        profile.sql_seconds += time.perf_counter() - start
+
+
+def add_execute_wrapper(wrapper):
+    """ Installs wrapper on every database connection, e.g. add_execute_wrapper(time_query). """
+
+    def install(sender, connection, **kwargs):
+        # connection_created is sent again on every reconnect
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
+
+    connection_created.connect(install, weak=False, dispatch_uid=f'{wrapper.__module__}.{wrapper.__qualname__}')
+
+
+add_execute_wrapper(time_query)
+
+
+class Template(DjangoTemplate):
+
+    def render(self, context=None, request=None):
+        profile = current_profile.get()
+        if profile is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        sql_seconds = profile.sql_seconds
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template_seconds += time.perf_counter() - start - (profile.sql_seconds - sql_seconds)
+
+
+class ProfilingDjangoTemplates(DjangoTemplates):
+    """ Django template backend timing the templates rendered by views (includes are part of their parent). """
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
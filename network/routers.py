@@ -0,0 +1,38 @@
+"""
+Database routing for a primary with read replicas.
+
+Reads go to a random alias of DATABASE_REPLICAS, writes to the primary
+(default). Reads stay on the primary inside transactions and while the
+request is pinned by ReplicaPinningMiddleware, i.e. for clients that wrote
+in the last DATABASE_REPLICA_PIN_SECONDS and may not find their writes on a
+lagging replica yet.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# True while the current request must read from the primary
+primary_pinned = ContextVar('primary_pinned', default=False)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas or primary_pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema by replication
+        return db == DEFAULT_DB_ALIAS
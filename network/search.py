@@ -0,0 +1,68 @@
+"""
+Full-text search over post content, backed by an SQLite FTS5 table.
+
+network_post_fts holds a copy of the content of every post under rowid =
+post id. It is updated when a post is created, edited or deleted, and can be
+rebuilt from the posts table with the rebuild_search_index command. On other
+databases than SQLite search finds nothing.
+"""
+import re
+
+from django.db import connection
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+
+FTS_TABLE = 'network_post_fts'
+# NUL ends the query string inside SQLite, other control characters are never part of a word
+CONTROL_RE = re.compile(r'[\x00-\x1f\x7f-\x9f]')
+
+
+def is_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def to_match_query(text):
+    """ Returns an FTS5 query matching every word of text, with operators and quotes taken literally. """
+    words = CONTROL_RE.sub(' ', text).split()
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in words)
+
+
+def index_post(post):
+    """ Adds or replaces the content of post in the index. """
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, content) VALUES (%s, %s)', [post.pk, post.content])
+
+
+def remove_post(post_id):
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild_index():
+    """ Refills the index from the posts table and returns the number of indexed posts. """
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, content) SELECT id, content FROM network_post')
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def matching_ids(match_query):
+    """ Returns a subquery of the ids of posts matching an FTS5 query. """
+    return RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match_query])
+
+
+def score(match_query):
+    """ Returns the relevance of the post to an FTS5 query, higher is better (negated bm25 rank). """
+    return RawSQL(
+        f'SELECT -rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = network_post.id',
+        [match_query],
+        output_field=FloatField()
+    )
@@ -0,0 +1,112 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import metrics, search, thumbnails
+from .backends import invalidate_user, load_user
+from .caching import invalidate_index_pages
+from .models import User, Post, TimelineEntry, count_of
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    """ Pushes a newly created post into the timelines of the creator's followers. """
+    if created:
+        TimelineEntry.fan_out(instance)
+        search.index_post(instance)
+        instance.update_tags(replace=False)
+        invalidate_index_pages()
+        metrics.count_on_commit('network_posts_created_total')
+        if instance.created_by_id is not None:
+            User.objects.filter(pk=instance.created_by_id).update(posts_count=F('posts_count') + 1)
+
+
+@receiver(post_save, sender=User)
+def make_thumbnails(sender, instance, update_fields=None, **kwargs):
+    """ Renders the thumbnails of a new or changed user image, a new image always has a new name. """
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    if instance.image:
+        thumbnails.make_variants(instance.image)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_user(sender, instance, update_fields=None, **kwargs):
+    """ Drops the cached copy of a changed user, it is loaded again on the next request. """
+    # the last_login update of every login keeps the copy cached below
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    invalidate_user(instance.pk)
+
+
+@receiver(user_logged_in)
+def cache_logged_in_user(sender, request, user, **kwargs):
+    """ Caches the user at login, so the requests after it need no query for identity. """
+    load_user(user.pk)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    """ Keeps the posts counter of the creator and the search index in line with deleted posts. """
+    search.remove_post(instance.pk)
+    if instance.created_by_id is not None:
+        User.objects.filter(pk=instance.created_by_id, posts_count__gt=0).update(posts_count=F('posts_count') - 1)
+
+
+@receiver(m2m_changed, sender=User.followed_by.through)
+def sync_timeline_on_follow(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Backfills or prunes timelines and recounts the counters when follows are added or removed through the managers. """
+
+    # before clearing collect the affected users, as pk_set is not provided
+    if action == 'pre_clear':
+        related = instance.following if reverse else instance.followed_by
+        instance._cleared_follow_ids = set(related.values_list('id', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_follow_ids', set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+
+    for other in User.objects.filter(pk__in=pk_set):
+        # reverse: instance is the follower (instance.following was changed)
+        follower, followed = (instance, other) if reverse else (other, instance)
+        if action == 'post_add':
+            TimelineEntry.backfill(follower, followed)
+        else:
+            TimelineEntry.prune(follower, followed)
+
+    # pk_set of post_remove may list users that were not followed, recount instead of counting
+    Follow = User.followed_by.through
+    User.objects.filter(pk__in={instance.pk, *pk_set}).update(
+        followers_count=count_of(Follow.objects.all(), 'from_user'),
+        following_count=count_of(Follow.objects.all(), 'to_user'),
+    )
+
+
+@receiver(m2m_changed, sender=Post.liked_by.through)
+def count_likes(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Recounts the likes of posts whose likes are added or removed through the managers. """
+
+    # before clearing collect the affected posts, as pk_set is not provided
+    if action == 'pre_clear':
+        if reverse:
+            instance._cleared_liked_post_ids = set(instance.liked_posts.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    # reverse: instance is the user (instance.liked_posts was changed)
+    if not reverse:
+        post_ids = {instance.pk}
+    elif action == 'post_clear':
+        post_ids = getattr(instance, '_cleared_liked_post_ids', set())
+    else:
+        post_ids = pk_set
+    Post.objects.filter(pk__in=post_ids).update(
+        likes_count=count_of(Post.liked_by.through.objects.all(), 'post'),
+        version=F('version') + 1,
+        modified_time=timezone.now()
+    )
@@ -0,0 +1,174 @@
+"""
+Slow query log.
+
+Every database connection gets an execute wrapper that times the queries.
+Queries slower than SLOW_QUERY_THRESHOLD_MS that were issued from code of
+the network app are kept with their parameters, the view of the request,
+the calling line and the query plan (EXPLAIN QUERY PLAN on SQLite) in a
+ring buffer of the last SLOW_QUERY_LOG_SIZE entries. Parameters of queries
+on passwords and sessions are redacted. With SLOW_QUERY_DIR set, every
+process also writes its buffer to <SLOW_QUERY_DIR>/<pid>.json, so the
+slow_queries command and the admin page see all processes. Clearing the log
+writes a new token to <SLOW_QUERY_DIR>/cleared: processes drop their buffer
+when the token changes, and files written before are ignored.
+"""
+import collections
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import pidfiles
+from .profiling import add_execute_wrapper, current_profile
+
+
+logger = logging.getLogger(__name__)
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+# instrumentation that is on the stack of every query of a request
+IGNORED_FILES = {os.path.join(PACKAGE_DIR, name) for name in ('middleware.py', 'profiling.py', 'slowlog.py')}
+# queries whose parameters may hold session data or password hashes: ones on sessions and ones inserting or
+# comparing passwords, selecting the password column of users takes no parameter for it
+SECRET_SQL_RE = re.compile(r'"django_session"|^INSERT\b.*"password"|"password"\s*(?:[=<>!]|IN\b|LIKE\b|GLOB\b)', re.S)
+
+
+class SlowQueryLog:
+    """ Ring buffer of the slow queries of this process. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = collections.deque(maxlen=getattr(settings, 'SLOW_QUERY_LOG_SIZE', 100))
+        # the token of SLOW_QUERY_DIR/cleared the entries were logged after
+        self.cleared = None
+
+    def add(self, entry):
+        slow_query_dir = getattr(settings, 'SLOW_QUERY_DIR', None)
+        with self.lock:
+            if slow_query_dir:
+                cleared = read_cleared(slow_query_dir)
+                if cleared != self.cleared:
+                    # the log was cleared, maybe by another process
+                    self.entries.clear()
+                    self.cleared = cleared
+            self.entries.append(entry)
+            data = {'cleared': self.cleared, 'entries': list(self.entries)}
+        if slow_query_dir:
+            # slow queries are rare, rewriting the whole buffer is cheap
+            pidfiles.write_process_file(slow_query_dir, data)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def read_cleared(slow_query_dir):
+    """ Returns the token of the last clear of the log in slow_query_dir, or None if it was never cleared. """
+    try:
+        with open(os.path.join(slow_query_dir, 'cleared')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def redact(sql, params):
+    """ Returns params as JSON, dates and the like as strings, or '[redacted]' if they may be secrets. """
+    if SECRET_SQL_RE.search(sql):
+        return '[redacted]'
+    return json.loads(json.dumps(list(params or ()), default=str))
+
+
+def get_caller():
+    """ Returns 'path:line in function' of the innermost frame of the network app, or None if there is none. """
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PACKAGE_DIR) and filename not in IGNORED_FILES:
+            return f'{os.path.relpath(filename, os.path.dirname(PACKAGE_DIR))}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+def explain(connection, sql, params):
+    """ Returns the lines of the query plan of sql. """
+    # a cursor of the backend itself, a Django cursor would run this wrapper again
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+        return [' | '.join(str(column) for column in row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def log_slow_queries(execute, sql, params, many, context):
+    """ Execute wrapper adding queries over SLOW_QUERY_THRESHOLD_MS to the slow query log. """
+    threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None)
+    if threshold is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration_ms = (time.perf_counter() - start) * 1000
+    if duration_ms < threshold:
+        return result
+
+    caller = get_caller()
+    if caller is None:
+        return result
+    connection = context['connection']
+    try:
+        plan = [] if many else explain(connection, sql, params)
+    except Exception as e:
+        plan = [f'EXPLAIN failed: {e}']
+    profile = current_profile.get()
+    slow_query_log.add({
+        'time': timezone.now().isoformat(timespec='seconds'),
+        'duration_ms': round(duration_ms, 2),
+        'database': connection.alias,
+        'sql': sql,
+        'params': redact(sql, params if not many else ()),
+        'view': getattr(profile, 'view', None),
+        'caller': caller,
+        'plan': plan,
+    })
+    logger.warning('Slow query (%.1f ms) from %s: %s', duration_ms, caller, sql)
+    return result
+
+
+add_execute_wrapper(log_slow_queries)
+
+
+def get_slow_queries():
+    """ Returns the slow queries of all processes with SLOW_QUERY_DIR, else of this one, slowest first. """
+    slow_query_dir = getattr(settings, 'SLOW_QUERY_DIR', None)
+    if not slow_query_dir:
+        with slow_query_log.lock:
+            entries = list(slow_query_log.entries)
+    else:
+        entries = []
+        cleared = read_cleared(slow_query_dir)
+        for data in pidfiles.read_process_files(slow_query_dir):
+            # skip files written before the last clear by a process that had not seen it yet
+            if data['cleared'] == cleared:
+                entries += data['entries']
+    return sorted(entries, key=lambda entry: entry['duration_ms'], reverse=True)
+
+
+def clear_slow_queries():
+    """ Empties the slow query log of this process, and with SLOW_QUERY_DIR those of all processes. """
+    slow_query_dir = getattr(settings, 'SLOW_QUERY_DIR', None)
+    if not slow_query_dir:
+        slow_query_log.clear()
+        return
+    os.makedirs(slow_query_dir, exist_ok=True)
+    pidfiles.write_json(os.path.join(slow_query_dir, 'cleared'), uuid.uuid4().hex)
+    slow_query_log.clear()
+    pidfiles.remove_process_files(slow_query_dir)
+
+
+slow_query_log = SlowQueryLog()
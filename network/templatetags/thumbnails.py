@@ -0,0 +1,17 @@
+from django import template
+from django.utils.html import format_html
+
+from network.thumbnails import SIZES, get_variant_url
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail(image, variant, css_class=''):
+    """ Renders an <img> of a variant of image with its size set, e.g. {% thumbnail user.image 'small' %} """
+    size = SIZES[variant]
+    return format_html(
+        '<img class="{}" src="{}" width="{}" height="{}" alt="" loading="lazy">',
+        css_class, get_variant_url(image, variant), size, size
+    )
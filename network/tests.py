@@ -1,21 +1,45 @@
+import base64
+import io
 import json
-
-from django.test import TestCase, Client
+import logging
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import AsyncClient, TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse, resolve
 
-from .models import User, Post
-from . import views
+from .models import User, Post, TimelineEntry, Hashtag, PostTag, Mention
+from . import backends, caching, likes, metrics, slowlog, thumbnails, urls, views, writer
+from .management.commands.benchmark import SKIPPED, get_routes
+from .middleware import PIN_COOKIE
+from .routers import ReplicaRouter
 from django.conf import settings
 
 from django.test import LiveServerTestCase
 from selenium import webdriver
 from selenium.common.exceptions import NoSuchElementException
+from PIL import Image
 
 
 # initialize the APIClient app
 client = Client()
 
 
+@override_settings(ANONYMOUS_PAGE_CACHE_TIMEOUT=0)
 class IndexPageViewTestCase(TestCase):
 
     @classmethod
@@ -89,6 +113,40 @@ class IndexPageViewTestCase(TestCase):
         self.assertEqual(len(response.context["page_obj"]), 5)
 
 
+    def test_view_cursor_pagination(self):
+        """ Tests walking the pages with cursor tokens. """
+        response = client.get('/')
+        page_obj = response.context["page_obj"]
+        self.assertEqual(len(page_obj), 10)
+        self.assertFalse(page_obj.has_previous())
+        self.assertContains(response, f'?cursor={page_obj.next_cursor}')
+        first_ids = [post.id for post in page_obj]
+
+        # walk forward to the last page
+        response = client.get(f'/?cursor={page_obj.next_cursor}')
+        page_obj = response.context["page_obj"]
+        self.assertEqual(len(page_obj), 10)
+        response = client.get(f'/?cursor={page_obj.next_cursor}')
+        page_obj = response.context["page_obj"]
+        self.assertEqual(len(page_obj), 5)
+        self.assertFalse(page_obj.has_next())
+
+        # walk back to the first page
+        response = client.get(f'/?cursor={page_obj.previous_cursor}')
+        page_obj = response.context["page_obj"]
+        self.assertEqual(len(page_obj), 10)
+        response = client.get(f'/?cursor={page_obj.previous_cursor}')
+        page_obj = response.context["page_obj"]
+        self.assertEqual([post.id for post in page_obj], first_ids)
+        self.assertFalse(page_obj.has_previous())
+
+
+    def test_view_invalid_cursor_returns_first_page(self):
+        response = client.get('/?cursor=invalid')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["page_obj"]), 10)
+        self.assertFalse(response.context["page_obj"].has_previous())
+
 
 
 class FollowingPageViewTestCase(TestCase):
@@ -170,6 +228,16 @@ class FollowingPageViewTestCase(TestCase):
         self.assertEqual(response.status_code, 302)
 
 
+    def test_view_shows_like_state_of_viewer(self):
+        u1 = User.objects.get(pk=1)
+        p = Post.objects.filter(created_by__username='u4').order_by('-created_time').first()
+        p.like(u1)
+
+        response = client.get('/following')
+        self.assertEqual([post.id for post in response.context["page_obj"] if post.liked_by_viewer], [p.id])
+        self.assertContains(response, 'data-isliking="1"', count=1)
+
+
     def test_view_pagination(self):
         """ Tests page pagination. """
         response = client.get('/following')
@@ -194,7 +262,56 @@ class FollowingPageViewTestCase(TestCase):
 
 
 
-class CustomUserModelTests(TestCase):
+class FeedQueryCountTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Create users
+        users = [User.objects.create(username=f'u{i}') for i in range(1, 6)]
+        u1 = users[0]
+
+        # create posts of several people, liked by everyone
+        for user in users:
+            u1.follow(user)
+            for _ in range(3):
+                post = Post.objects.create(created_by=user, content='abc')
+                for liker in users:
+                    post.like(liker)
+
+
+    def setUp(self):
+        # log in user 1
+        u1 = User.objects.get(pk=1)
+        client.force_login(u1)
+
+
+    def tearDown(self):
+        client.logout()
+
+
+    def test_index_queries(self):
+        # page of posts, session and user come from the cache
+        with self.assertNumQueries(1):
+            response = client.get(reverse('index'))
+        self.assertContains(response, 'data-isliking="1"', count=10)
+
+
+    def test_following_queries(self):
+        # page of posts
+        with self.assertNumQueries(1):
+            client.get(reverse('following'))
+
+
+    def test_profile_queries(self):
+        # profile user, page of posts
+        with self.assertNumQueries(2):
+            client.get(reverse('profiles', kwargs={'user_id': 2}))
+
+
+
+class CachedUserTestCase(TestCase):
 
     @classmethod
     def setUpClass(cls):
@@ -202,112 +319,213 @@ class CustomUserModelTests(TestCase):
 
         # Create users
         u1 = User.objects.create(username='u1')
-        u2 = User.objects.create(username='u2')
-        u3 = User.objects.create(username='u3')
+        u1.set_password('secret')
+        u1.save()
+        Post.objects.create(created_by=u1, content='abc')
 
-        # create posts
-        p1 = Post.objects.create(created_by=u1, content='abc')
-        p2 = Post.objects.create(created_by=u1, content='def')
-        p3 = Post.objects.create(created_by=u2, content='ghi')
 
-        # create follows
-        u1.following.add(u2)
-        u1.following.add(u3)
-        u2.following.add(u1)
+    def setUp(self):
+        # log in user 1, which caches the session and the user
+        cache.clear()
+        client.force_login(User.objects.get(username='u1'))
 
-        # add likes
-        u1.liked_posts.add(p3)
-        u3.liked_posts.add(p1)
-        u3.liked_posts.add(p2)
-        u3.liked_posts.add(p3)
 
+    def tearDown(self):
+        client.logout()
 
-    def test_create_user(self):
-        user = User.objects.create_user(
-            username='adam',
-            email='adam@email.com',
-            password='pwd123'
-        )
-        self.assertEqual(user.username, 'adam')
-        self.assertEqual(user.email, 'adam@email.com')
-        self.assertTrue(user.is_active)
-        self.assertFalse(user.is_staff)
-        self.assertFalse(user.is_superuser)
 
+    def test_no_identity_queries(self):
+        # page of posts
+        with self.assertNumQueries(1):
+            client.get(reverse('index'))
+        with self.assertNumQueries(1):
+            client.get(reverse('index'))
 
-    def test_create_superuser(self):
-        admin_user = User.objects.create_superuser(
-            username='superadmin',
-            email='superadmin@email.com',
-            password='test123'
-        )
-        self.assertEqual(admin_user.username, 'superadmin')
-        self.assertEqual(admin_user.email, 'superadmin@email.com')
-        self.assertTrue(admin_user.is_active)
-        self.assertTrue(admin_user.is_staff)
-        self.assertTrue(admin_user.is_superuser)
 
+    def test_loaded_once_after_expiry(self):
+        cache.delete(backends.user_cache_key(1))
+        # user, page of posts
+        with self.assertNumQueries(2):
+            client.get(reverse('index'))
+        with self.assertNumQueries(1):
+            client.get(reverse('index'))
 
-    def test_likes_count(self):
-        u1 = User.objects.get(username='u1')
-        u2 = User.objects.get(username='u2')
-        u3 = User.objects.get(username='u3')
 
-        self.assertEqual(u1.liked_posts.count(), 1)     
-        self.assertEqual(u2.liked_posts.count(), 0)     
-        self.assertEqual(u3.liked_posts.count(), 3)     
+    def test_profile_change(self):
+        u1 = User.objects.get(username='u1')
+        u1.username = 'renamed'
+        u1.save()
+        response = client.get(reverse('index'))
+        self.assertEqual(response.context['user'].username, 'renamed')
 
 
-    def test_posts_count(self):
+    def test_password_change(self):
         u1 = User.objects.get(username='u1')
-        u2 = User.objects.get(username='u2')
-        u3 = User.objects.get(username='u3')
+        u1.set_password('changed')
+        u1.save()
+        # the session hash no longer matches, the user is logged out
+        response = client.get(reverse('following'))
+        self.assertEqual(response.status_code, 302)
 
-        self.assertEqual(Post.objects.all().count(), 3)
-        self.assertEqual(u1.posts.count(), 2)
-        self.assertEqual(u2.posts.count(), 1)
-        self.assertEqual(u3.posts.count(), 0)
 
+    def test_counters_are_not_cached(self):
+        user = backends.CachedModelBackend().get_user(1)
+        self.assertEqual(set(user.get_deferred_fields()), set(backends.COUNTER_FIELDS))
+
+        # counters change through QuerySet.update(), which drops no cached copy
+        Post.objects.create(created_by=User.objects.get(username='u1'), content='def')
+        user = backends.CachedModelBackend().get_user(1)
+        self.assertEqual(user.posts_count, 2)
+
+        # saving the cached copy keeps the counters of the database
+        user = backends.CachedModelBackend().get_user(1)
+        User.objects.filter(pk=1).update(posts_count=5)
+        user.first_name = 'U'
+        user.save()
+        self.assertEqual(User.objects.get(pk=1).posts_count, 5)
+
+
+    def test_async(self):
+        user = async_to_sync(backends.CachedModelBackend().aget_user)(1)
+        self.assertEqual(user.username, 'u1')
+        cache.delete(backends.user_cache_key(1))
+        with self.assertNumQueries(1):
+            async_to_sync(backends.CachedModelBackend().aget_user)(1)
+        with self.assertNumQueries(0):
+            async_to_sync(backends.CachedModelBackend().aget_user)(1)
+
+
+    @override_settings(USER_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        # session from the cache, user, page of posts
+        with self.assertNumQueries(2):
+            client.get(reverse('index'))
+
+
+
+# performance budgets of every view and API endpoint, for the fixtures of
+# QueryBudgetTestCase (cold caches, just logged in):
+# (method, url name) -> (url kwargs, query string or JSON body, most queries, most milliseconds of SQL)
+QUERY_BUDGETS = {
+    # pages: page of posts (+ the profile user or hashtag), session and user come from the cache
+    ('GET', 'index'): ({}, '', 1, 10),
+    ('GET', 'following'): ({}, '', 1, 10),
+    ('GET', 'profiles'): ({'user_id': 2}, '', 2, 10),
+    ('GET', 'search'): ({}, 'q=abc', 1, 20),
+    ('GET', 'tag'): ({'name': 'abc'}, '', 2, 10),
+    ('GET', 'mentions'): ({}, '', 1, 10),
+    ('GET', 'login'): ({}, '', 0, 10),
+    ('GET', 'register'): ({}, '', 0, 10),
+    # redirects to the admin login, u1 is not staff
+    ('GET', 'slow_queries'): ({}, '', 0, 10),
+
+    # feeds: page of posts (+ the hashtag)
+    ('GET', 'feed'): ({}, '', 1, 10),
+    ('GET', 'following_feed'): ({}, '', 1, 10),
+    ('GET', 'profile_feed'): ({'user_id': 2}, '', 1, 10),
+    ('GET', 'search_feed'): ({}, 'q=abc', 1, 20),
+    ('GET', 'tag_feed'): ({'name': 'abc'}, '', 2, 10),
+    ('GET', 'mentions_feed'): ({}, '', 1, 10),
+
+    # API: one query per object (likers: post and page of likers)
+    ('GET', 'posts'): ({}, 'ids=1,2,3,4,5,6,7,8,9,10', 1, 10),
+    ('GET', 'post'): ({'post_id': 1}, '', 1, 10),
+    ('GET', 'likers'): ({'post_id': 1}, '', 2, 10),
+    ('GET', 'follow_statuses'): ({}, 'ids=2,3,4,5', 1, 10),
+    ('GET', 'follow'): ({'user_id': 2}, '', 2, 10),
+    ('GET', 'async_posts'): ({}, 'ids=1,2,3,4,5,6,7,8,9,10', 1, 10),
+    ('GET', 'async_post'): ({'post_id': 1}, '', 1, 10),
+    ('GET', 'async_follow_statuses'): ({}, 'ids=2,3,4,5', 1, 10),
+    ('GET', 'async_follow'): ({'user_id': 2}, '', 2, 10),
+    ('GET', 'metrics'): ({}, '', 0, 10),
+
+    # writes: the queries of the signals (counters, timelines, tags, search index) included
+    ('POST', 'posts'): ({}, {'post_content': 'abc #abc @u1'}, 12, 20),
+    ('PUT', 'post'): ({'post_id': 1}, {'liking': False}, 7, 20),
+    ('PUT', 'follow'): ({'user_id': 3}, {'isfollowing': False}, 9, 20),
+    ('POST', 'async_posts'): ({}, {'post_content': 'abc #abc @u1'}, 12, 20),
+    ('PUT', 'async_post'): ({'post_id': 2}, {'liking': False}, 7, 20),
+    ('PUT', 'async_follow'): ({'user_id': 4}, {'isfollowing': False}, 9, 20),
+}
+
+
+
+class SQLTimer:
+    """ Database execute wrapper adding up the time spent in SQL. """
+
+    def __init__(self):
+        self.seconds = 0
+
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+
+
+class QueryBudgetTestCase(TestCase):
+    """ Fails when a view needs more queries or SQL time than its entry in QUERY_BUDGETS. """
 
-    def test_follows_count(self):
-        u1 = User.objects.get(username='u1')
-        u2 = User.objects.get(username='u2')
-        u3 = User.objects.get(username='u3')
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
 
-        self.assertEqual(u1.followed_by.count(), 1)
-        self.assertEqual(u2.followed_by.count(), 1)
-        self.assertEqual(u3.followed_by.count(), 1)
+        # Create users
+        users = User.objects.bulk_create([User(username=f'u{i}') for i in range(1, 301)])
+        u1 = users[0]
 
-        self.assertEqual(u1.following.count(), 2)
-        self.assertEqual(u2.following.count(), 1)
-        self.assertEqual(u3.following.count(), 0)
+        # u1 follows 5 people, who write 10 posts liked by all 300 users
+        Like = Post.liked_by.through
+        for user in users[1:6]:
+            u1.follow(user)
+            for _ in range(2):
+                post = Post.objects.create(created_by=user, content='abc #abc @u1')
+                Like.objects.bulk_create([Like(post=post, user=liker) for liker in users])
+        call_command('recount_counters', stdout=io.StringIO())
 
 
-    def test_get_posts_of_followed_people(self):
-        u1 = User.objects.get(username='u1')
-        u2 = User.objects.get(username='u2')
-        u3 = User.objects.get(username='u3')
+    def setUp(self):
+        # log in user 1, with cold caches
+        cache.clear()
+        client.force_login(User.objects.get(username='u1'))
 
-        p1 = Post.objects.get(pk=1)
-        p2 = Post.objects.get(pk=2)
-        p3 = Post.objects.get(pk=3)
 
-        posts1 = u1.get_posts_of_followed_people()
-        self.assertEqual(len(posts1), 1)
-        self.assertIn(p3, posts1)
-        
-        posts2 = u2.get_posts_of_followed_people()
-        self.assertEqual(len(posts2), 2)
+    def tearDown(self):
+        client.logout()
 
-        self.assertIn(p1, posts2)
-        self.assertIn(p2, posts2)
-        
-        posts3 = u3.get_posts_of_followed_people()
-        self.assertEqual(len(posts3), 0)
 
+    def test_every_route_has_a_budget(self):
+        url_names = {pattern.name for pattern in urls.urlpatterns} - {'logout'}
+        self.assertEqual(url_names - {url_name for _, url_name in QUERY_BUDGETS}, set())
 
 
-class PostModelTestCase(TestCase):
+    def test_budgets(self):
+        for (method, url_name), (kwargs, data, max_queries, max_ms) in QUERY_BUDGETS.items():
+            with self.subTest(f'{method} {url_name}'):
+                url = reverse(url_name, kwargs=kwargs)
+                timer = SQLTimer()
+                with CaptureQueriesContext(connection) as context, connection.execute_wrapper(timer):
+                    if method == 'GET':
+                        response = client.get(f'{url}?{data}')
+                    else:
+                        response = client.generic(method, url, json.dumps(data), content_type='application/json')
+                self.assertLess(response.status_code, 400)
+
+                queries = '\n'.join(query['sql'] for query in context.captured_queries)
+                self.assertLessEqual(
+                    len(context.captured_queries), max_queries, f'{method} {url} made too many queries:\n{queries}'
+                )
+                self.assertLessEqual(
+                    timer.seconds * 1000, max_ms, f'{method} {url} spent too long in SQL:\n{queries}'
+                )
+
+
+
+@override_settings(PROFILING_SAMPLE_RATE=1)
+class ProfilingTestCase(TestCase):
 
     @classmethod
     def setUpClass(cls):
@@ -315,152 +533,1392 @@ class PostModelTestCase(TestCase):
 
         # Create users
         u1 = User.objects.create(username='u1')
-        u2 = User.objects.create(username='u2')
-        u3 = User.objects.create(username='u3')
-
         # create posts
-        p1 = Post.objects.create(created_by=u1, content='abc')
-        p2 = Post.objects.create(created_by=u1, content='def')
-        p3 = Post.objects.create(created_by=u2, content='ghi')
+        for _ in range(3):
+            Post.objects.create(created_by=u1, content='abc')
 
-        # add likes
-        u1.liked_posts.add(p3)
-        u3.liked_posts.add(p1)
-        u3.liked_posts.add(p2)
-        u3.liked_posts.add(p3)
 
+    def setUp(self):
+        # log in user 1, with cold caches
+        cache.clear()
+        client.force_login(User.objects.get(username='u1'))
 
-    def test_text_content(self):
-        p1 = Post.objects.get(id=1)
-        p2 = Post.objects.get(id=2)
-        p3 = Post.objects.get(id=3)
-        
-        content1 = f'{p1.content}'
-        content2 = f'{p2.content}'
-        content3 = f'{p3.content}'
-        
-        self.assertEqual(content1, 'abc')
-        self.assertEqual(content2, 'def')
-        self.assertEqual(content3, 'ghi')
+
+    def tearDown(self):
+        client.logout()
 
 
-    def test_likes_count(self):
+    def assertProfiled(self, url, queries):
+        """ Requests url and returns the profile logged for it, after checking it against the Server-Timing header. """
+        with self.assertLogs('network.profiling', 'INFO') as logs:
+            response = client.get(url)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record, logs.records[0].profile)
+        self.assertEqual(record['queries'], queries)
+        self.assertEqual(record['status'], 200)
 
-        p1 = Post.objects.get(id=1)
-        p2 = Post.objects.get(id=2)
-        p3 = Post.objects.get(id=3)  
-        
-        self.assertEqual(p1.liked_by.count(), 1)     
-        self.assertEqual(p2.liked_by.count(), 1)     
-        self.assertEqual(p3.liked_by.count(), 2)     
+        timings = dict(re.findall(r'(\w+);dur=([\d.]+)', response['Server-Timing']))
+        self.assertEqual(set(timings), {'db', 'tpl', 'app', 'total'})
+        self.assertIn(f'desc="{queries} queries"', response['Server-Timing'])
+        self.assertAlmostEqual(float(timings['db']), record['sql_ms'], places=1)
+        self.assertLessEqual(record['sql_ms'] + record['template_ms'], record['total_ms'])
+        return record
 
 
-    def test_get_all_posts(self):
+    def test_page(self):
+        # page of posts
+        record = self.assertProfiled(reverse('index'), 1)
+        self.assertEqual(record['url_name'], 'index')
+        self.assertEqual(record['method'], 'GET')
+        self.assertGreater(record['template_ms'], 0)
 
-        p1 = Post.objects.get(pk=1)
-        p2 = Post.objects.get(pk=2)
-        p3 = Post.objects.get(pk=3)
 
-        all_posts = Post.get_all_posts()
+    def test_api(self):
+        record = self.assertProfiled(reverse('post', kwargs={'post_id': 1}), 1)
+        self.assertEqual(record['template_ms'], 0)
 
-        self.assertEqual(len(all_posts), 3)
-        self.assertIn(p1, all_posts)
-        self.assertIn(p2, all_posts)
-        self.assertIn(p3, all_posts)
 
+    def test_async_view(self):
+        # queries of async views run in other threads
+        record = self.assertProfiled(reverse('async_post', kwargs={'post_id': 1}), 1)
+        self.assertEqual(record['url_name'], 'async_post')
 
 
-class PostAPITestCase(TestCase):
-    
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_disabled(self):
+        with self.assertNoLogs('network.profiling'):
+            response = client.get(reverse('index'))
+        self.assertNotIn('Server-Timing', response)
+
+
+
+class MetricsTestCase(TestCase):
+
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
 
-        # Create user
+        # Create users
         u1 = User.objects.create(username='u1')
         u2 = User.objects.create(username='u2')
-
         # create posts
-        p1 = Post.objects.create(
-            created_by=u1,
-            content='abc'
-        )
-        p2 = Post.objects.create(created_by=u2)
+        Post.objects.create(created_by=u2, content='abc')
 
-        # add likes
-        p1.liked_by.add(u2)
 
-        # Create PUT payloads
-        cls.payload_change_content = {
-            'post_content': 'def',
-        }
-        cls.payload_like = {
-            'liking': True,
-        }
-        cls.payload_unlike = {
-            'liking': False,
-        }
+    def setUp(self):
+        # start every test with an empty registry
+        self.registry = metrics.Registry()
+        patcher = mock.patch.object(metrics, 'registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        client.force_login(User.objects.get(username='u1'))
+
+
+    def tearDown(self):
+        client.logout()
+
+
+    def get_samples(self):
+        """ Returns {sample with labels: value} of /metrics. """
+        response = client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        lines = response.content.decode().splitlines()
+        return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1]) for line in lines if not line.startswith('#')}
+
+
+    def test_request_metrics(self):
+        client.get(reverse('index'))
+        client.get(reverse('index'))
+        client.get(reverse('post', kwargs={'post_id': 1}))
+        client.get('/no-such-page')
+        samples = self.get_samples()
+
+        self.assertEqual(samples['http_requests_total{method="GET",status="200",url_name="index"}'], 2)
+        self.assertEqual(samples['http_requests_total{method="GET",status="200",url_name="post"}'], 1)
+        self.assertEqual(samples['http_requests_total{method="GET",status="404",url_name="unmatched"}'], 1)
+        self.assertEqual(samples['http_request_duration_seconds_count{url_name="index"}'], 2)
+        self.assertEqual(samples['http_request_duration_seconds_bucket{url_name="index",le="+Inf"}'], 2)
+        # the post, session and user come from the cache
+        self.assertEqual(samples['http_request_queries_bucket{url_name="post",le="0"}'], 0)
+        self.assertEqual(samples['http_request_queries_bucket{url_name="post",le="1"}'], 1)
+        self.assertEqual(samples['http_request_queries_sum{url_name="post"}'], 1)
+
+
+    def test_write_counters(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(reverse('posts'), {'post_content': 'def'}, content_type='application/json')
+            client.put(reverse('post', kwargs={'post_id': 1}), {'liking': True}, content_type='application/json')
+            client.put(reverse('post', kwargs={'post_id': 1}), {'liking': True}, content_type='application/json')
+            client.put(reverse('follow', kwargs={'user_id': 2}), {'isfollowing': True}, content_type='application/json')
+            client.put(reverse('follow', kwargs={'user_id': 2}), {'isfollowing': False}, content_type='application/json')
+        samples = self.get_samples()
+
+        self.assertEqual(samples['network_posts_created_total'], 1)
+        # liking twice counts once
+        self.assertEqual(samples['network_likes_total'], 1)
+        self.assertEqual(samples['network_follows_total'], 1)
+        self.assertEqual(samples['network_unfollows_total'], 1)
+        self.assertNotIn('network_unlikes_total', samples)
+
+
+    def test_processes_add_up(self):
+        metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metrics_dir)
+
+        # another worker process left its file
+        other = metrics.Registry()
+        other.inc('network_likes_total', 2)
+        other.observe('http_request_duration_seconds', 0.02, url_name='index')
+        with open(f'{metrics_dir}/1.json', 'w') as f:
+            json.dump(other.snapshot(), f)
+
+        self.registry.inc('network_likes_total', 3)
+        with override_settings(METRICS_DIR=metrics_dir):
+            client.get(reverse('index'))
+            samples = self.get_samples()
+        self.assertEqual(samples['network_likes_total'], 5)
+        self.assertEqual(samples['http_request_duration_seconds_count{url_name="index"}'], 2)
+        self.assertGreaterEqual(samples['http_request_duration_seconds_bucket{url_name="index",le="0.025"}'], 1)
+        self.assertTrue(os.path.exists(f'{metrics_dir}/{os.getpid()}.json'))
+
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_DIR=None)
+class SlowQueryLogTestCase(TestCase):
+    """ Logs every query (threshold 0), the unindexed sort on content is the regression to find. """
+
+    @classmethod
+    def setUpClass(cls):
+        # keep the warning of every query out of the test output
+        logging.disable(logging.WARNING)
+        cls.addClassCleanup(logging.disable, logging.NOTSET)
+        super().setUpClass()
+
+        # Create users
+        u1 = User.objects.create(username='u1')
+        User.objects.create(username='admin', is_staff=True)
+        # create posts
+        for _ in range(3):
+            Post.objects.create(created_by=u1, content='abc')
 
 
     def setUp(self):
-        # log in user 1
-        u1 = User.objects.get(pk=1)
-        client.force_login(u1)
+        client.force_login(User.objects.get(username='u1'))
+        slowlog.slow_query_log.clear()
 
 
     def tearDown(self):
         client.logout()
 
 
-    def test_get_existing_post(self):
+    def get_logged(self, text):
+        """ Returns the logged queries whose SQL contains text. """
+        return [query for query in slowlog.get_slow_queries() if text in query['sql']]
 
-        p1 = Post.objects.get(pk=1)
-        u2 = User.objects.get(pk=2)
 
-        response = client.get(reverse('post', kwargs={'post_id': p1.id}))
-        data = response.json()
-        self.assertEqual(data['id'], 1)
-        self.assertEqual(data['content'], 'abc')
-        self.assertEqual(data['liked_by'], [u2.id])
-        self.assertEqual(response.status_code, 200)
+    def test_view_queries(self):
+        client.get(reverse('index'))
 
+        [query] = self.get_logged('FROM "network_post"')
+        self.assertEqual(query['view'], 'network.views.index')
+        self.assertTrue(query['caller'].startswith('network/'))
+        self.assertTrue(query['plan'])
+        self.assertEqual(len(query['params']), query['sql'].count('%s'))
 
-    def test_get_nonexisting_post_raises_error(self):
 
-        response = client.get(reverse('post', kwargs={'post_id': 99}))
-        data = response.json()
-        self.assertEqual(data['error'], "Post not found.")
-        self.assertEqual(response.status_code, 404)
+    def test_plan_of_unindexed_sort(self):
+        list(Post.objects.order_by('-content')[:1])
 
+        [query] = self.get_logged('ORDER BY "network_post"."content" DESC')
+        self.assertIsNone(query['view'])
+        self.assertIn('test_plan_of_unindexed_sort', query['caller'])
+        self.assertTrue(any('TEMP B-TREE' in line for line in query['plan']), query['plan'])
 
-    def test_change_post_content(self):
 
-        p1 = Post.objects.get(pk=1)
+    def test_threshold(self):
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=10000):
+            client.get(reverse('index'))
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=None):
+            client.get(reverse('index'))
+        self.assertEqual(slowlog.get_slow_queries(), [])
 
-        # test content before request
-        self.assertEqual(p1.content, 'abc')
 
-        # put request
-        response = client.put(
-            reverse('post', kwargs={'post_id': p1.id}),
-            data=json.dumps(self.payload_change_content),
-            content_type='application/json'
-        )
-        self.assertEqual(response.status_code, 204)
-        
-        # test content after request     
-        p1 = Post.objects.get(pk=1)   
-        self.assertEqual(p1.content, 'def')
+    def test_ring_buffer(self):
+        for _ in range(slowlog.slow_query_log.entries.maxlen + 10):
+            Post.objects.exists()
+        self.assertEqual(len(slowlog.get_slow_queries()), slowlog.slow_query_log.entries.maxlen)
 
 
-    def test_like_unlike(self):
-        p2 = Post.objects.get(pk=2)
-        u1 = User.objects.get(username='u1')
+    def test_files_of_processes(self):
+        slow_query_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, slow_query_dir)
+        with override_settings(SLOW_QUERY_DIR=slow_query_dir):
+            Post.objects.exists()
+            # another process left its file
+            other = {'cleared': None, 'entries': [{**slowlog.get_slow_queries()[0], 'duration_ms': 1000}]}
+            with open(f'{slow_query_dir}/1.json', 'w') as f:
+                json.dump(other, f)
 
-        # test initial status
-        self.assertEqual(list(p2.liked_by.all()), [])
+            slow_queries = slowlog.get_slow_queries()
+            self.assertEqual(len(slow_queries), 2)
+            self.assertEqual(slow_queries[0]['duration_ms'], 1000)
 
-        # like
+            slowlog.clear_slow_queries()
+            self.assertEqual(slowlog.get_slow_queries(), [])
+
+            # the other process writes its old entries again before it sees the clear
+            with open(f'{slow_query_dir}/1.json', 'w') as f:
+                json.dump(other, f)
+            self.assertEqual(slowlog.get_slow_queries(), [])
+
+
+    def test_clear_by_other_process(self):
+        slow_query_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, slow_query_dir)
+        with override_settings(SLOW_QUERY_DIR=slow_query_dir):
+            Post.objects.exists()
+            with open(f'{slow_query_dir}/cleared', 'w') as f:
+                json.dump('other', f)
+            list(Post.objects.order_by('-content')[:1])
+
+            [query] = slowlog.get_slow_queries()
+            self.assertIn('ORDER BY', query['sql'])
+
+
+    def test_secrets_are_redacted(self):
+        User.objects.filter(password='hunter2').exists()
+        User.objects.create_user('u2', password='hunter2')
+        User.objects.filter(username='u2').update(password='hunter2')
+        session = SessionStore()
+        session['token'] = 'hunter2'
+        session.save()
+        client.get(reverse('index'))
+
+        for query in self.get_logged('"password"') + self.get_logged('"django_session"'):
+            if query['view'] == 'network.views.index':
+                # selects users with their password column, that takes no parameter
+                self.assertNotEqual(query['params'], '[redacted]')
+            else:
+                self.assertEqual(query['params'], '[redacted]')
+        self.assertEqual(len(self.get_logged('"django_session"')), 2)
+        self.assertNotIn('hunter2', json.dumps(slowlog.get_slow_queries()))
+
+
+    def test_page(self):
+        list(Post.objects.order_by('-content')[:1])
+
+        # staff only
+        response = client.get(reverse('slow_queries'))
+        self.assertEqual(response.status_code, 302)
+
+        client.force_login(User.objects.get(username='admin'))
+        response = client.get(reverse('slow_queries'))
+        self.assertContains(response, 'in test_page')
+        self.assertContains(response, 'USE TEMP B-TREE FOR ORDER BY')
+
+        client.post(reverse('slow_queries'))
+        self.assertEqual(slowlog.get_slow_queries(), [])
+
+
+    def test_command(self):
+        list(Post.objects.order_by('-content')[:1])
+        out = io.StringIO()
+        call_command('slow_queries', stdout=out, stderr=io.StringIO())
+        self.assertIn('in test_command', out.getvalue())
+        self.assertIn('plan: ', out.getvalue())
+        self.assertIn('USE TEMP B-TREE FOR ORDER BY', out.getvalue())
+
+        call_command('slow_queries', '--clear', stdout=io.StringIO())
+        self.assertEqual(slowlog.get_slow_queries(), [])
+
+
+
+class PostCardCacheTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Create users
+        u1 = User.objects.create(username='u1')
+        u2 = User.objects.create(username='u2')
+
+        # create post
+        Post.objects.create(created_by=u1, content='abc')
+
+
+    def setUp(self):
+        cache.clear()
+        # log in user 1
+        u1 = User.objects.get(pk=1)
+        client.force_login(u1)
+
+
+    def tearDown(self):
+        client.logout()
+
+
+    def test_card_is_served_from_cache(self):
+        client.get(reverse('index'))
+
+        # change content behind the back of the cache
+        Post.objects.filter(pk=1).update(content='stale')
+        response = client.get(reverse('index'))
+        self.assertContains(response, 'abc')
+        self.assertNotContains(response, 'stale')
+
+
+    def test_edit_renders_new_version(self):
+        client.get(reverse('index'))
+        client.put(
+            reverse('post', kwargs={'post_id': 1}),
+            data=json.dumps({'post_content': 'def'}),
+            content_type='application/json'
+        )
+        response = client.get(reverse('index'))
+        self.assertContains(response, 'def')
+        self.assertNotContains(response, 'abc')
+
+
+    def test_like_renders_new_version(self):
+        client.get(reverse('index'))
+        client.put(
+            reverse('post', kwargs={'post_id': 1}),
+            data=json.dumps({'liking': True}),
+            content_type='application/json'
+        )
+        response = client.get(reverse('index'))
+        self.assertContains(response, '<span id="post-likes-1">1</span>')
+
+
+    def test_rename_renders_new_version(self):
+        # viewed by user 2, so the name of user 1 is only on the card
+        client.force_login(User.objects.get(pk=2))
+        client.get(reverse('index'))
+        u1 = User.objects.get(pk=1)
+        u1.username = 'renamed'
+        u1.save()
+        response = client.get(reverse('index'))
+        self.assertContains(response, 'renamed')
+
+
+    def test_cached_card_is_shared_between_viewers(self):
+        # creator sees the edit button and own like state
+        Post.objects.get(pk=1).like(User.objects.get(pk=1))
+        response = client.get(reverse('index'))
+        self.assertContains(response, 'Edit post')
+        self.assertContains(response, 'data-isliking="1"')
+
+        # another viewer gets the same card without them
+        client.force_login(User.objects.get(pk=2))
+        response = client.get(reverse('index'))
+        self.assertContains(response, 'abc')
+        self.assertNotContains(response, 'Edit post')
+        self.assertContains(response, 'data-isliking="0"')
+
+
+
+@override_settings(ANONYMOUS_PAGE_CACHE_TIMEOUT=30)
+class AnonymousPageCacheTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Create users
+        u1 = User.objects.create(username='u1')
+        # create posts
+        for _ in range(15):
+            Post.objects.create(created_by=u1, content='abc')
+
+
+    def setUp(self):
+        cache.clear()
+
+
+    def test_page_is_served_from_cache(self):
+        client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            response = client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<div class="posts">')
+
+
+    def test_pages_are_cached_separately(self):
+        response = client.get(f"{reverse('index')}?page=2")
+        self.assertContains(response, 'id="post-content-', count=5)
+        response = client.get(reverse('index'))
+        self.assertContains(response, 'id="post-content-', count=10)
+
+
+    def test_new_post_invalidates_cache(self):
+        client.get(reverse('index'))
+        Post.objects.create(created_by=User.objects.get(pk=1), content='new post')
+        response = client.get(reverse('index'))
+        self.assertContains(response, 'new post')
+
+
+    def test_stale_page_is_served_while_refreshed(self):
+        request = client.get(reverse('index')).wsgi_request
+        key = caching.index_page_key(request)
+
+        # another request is already refreshing the page
+        cache.add(f'{key}:lock', True)
+        Post.objects.create(created_by=User.objects.get(pk=1), content='new post')
+        with self.assertNumQueries(0):
+            response = client.get(reverse('index'))
+        self.assertNotContains(response, 'new post')
+
+        # once the lock is released the next request refreshes it
+        cache.delete(f'{key}:lock')
+        response = client.get(reverse('index'))
+        self.assertContains(response, 'new post')
+
+
+    def test_logged_in_users_bypass_cache(self):
+        client.get(reverse('index'))
+        client.force_login(User.objects.get(pk=1))
+        response = client.get(reverse('index'))
+        self.assertContains(response, 'Create new post')
+        client.logout()
+
+
+
+class ConditionalGetTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Create users
+        u1 = User.objects.create(username='u1')
+        u2 = User.objects.create(username='u2')
+
+        # create posts and follows
+        Post.objects.create(created_by=u2, content='abc')
+        u1.follow(u2)
+
+
+    def setUp(self):
+        cache.clear()
+        # log in user 1
+        u1 = User.objects.get(pk=1)
+        client.force_login(u1)
+
+
+    def tearDown(self):
+        client.logout()
+
+
+    def test_post_not_modified(self):
+        url = reverse('post', kwargs={'post_id': 1})
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('Last-Modified'))
+        etag = response['ETag']
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        response = client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+
+    def test_post_modified_after_like(self):
+        url = reverse('post', kwargs={'post_id': 1})
+        etag = client.get(url)['ETag']
+
+        Post.objects.get(pk=1).like(User.objects.get(pk=1))
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+    def test_feeds_not_modified(self):
+        for url in (reverse('index'), reverse('following'), reverse('profiles', kwargs={'user_id': 2})):
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('private', response['Cache-Control'])
+
+            response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+
+    def test_feed_modified_after_edit(self):
+        etag = client.get(reverse('following'))['ETag']
+        Post.objects.get(pk=1).edit('def')
+        response = client.get(reverse('following'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'def')
+
+
+    def test_feeds_modified_after_author_changes(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        image = io.BytesIO()
+        Image.new('RGB', (50, 50)).save(image, 'PNG')
+
+        urls = (reverse('index'), reverse('profiles', kwargs={'user_id': 2}))
+        changes = (('username', 'u2 renamed'), ('image', SimpleUploadedFile('u2.png', image.getvalue())))
+        with override_settings(MEDIA_ROOT=media_root):
+            for field, value in changes:
+                etags = [client.get(url)['ETag'] for url in urls]
+                u2 = User.objects.get(pk=2)
+                setattr(u2, field, value)
+                u2.save()
+                for url, etag in zip(urls, etags):
+                    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, 200, (field, url))
+
+
+    def test_feed_etag_depends_on_viewer(self):
+        etag = client.get(reverse('index'))['ETag']
+        client.force_login(User.objects.get(pk=2))
+        response = client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+    def test_feed_modified_after_login(self):
+        # the page renders the CSRF token, which login rotates
+        user = User.objects.get(pk=1)
+        user.set_password('secret')
+        user.save()
+        login_client = Client()
+        login_client.post(reverse('login'), {'username': 'u1', 'password': 'secret'})
+        etag = login_client.get(reverse('index'))['ETag']
+        login_client.get(reverse('logout'))
+        login_client.post(reverse('login'), {'username': 'u1', 'password': 'secret'})
+
+        response = login_client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+
+    def test_feed_modified_after_template_change(self):
+        etag = client.get(reverse('index'))['ETag']
+        with mock.patch.object(caching, 'get_template_version', return_value='next release'):
+            response = client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+    @override_settings(ANONYMOUS_PAGE_CACHE_TIMEOUT=30)
+    def test_cached_anonymous_page_not_modified(self):
+        client.logout()
+        response = client.get(reverse('index'))
+        self.assertIn('public', response['Cache-Control'])
+        response = client.get(reverse('index'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+
+class HashtagMentionTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Create users
+        u1 = User.objects.create(username='u1')
+        u2 = User.objects.create(username='u2')
+
+        # create 12 posts tagged #Django, mentioning user 1, and one untagged post
+        for i in range(12):
+            Post.objects.create(created_by=u2, content=f'post {i} on #Django for @u1.')
+        Post.objects.create(created_by=u2, content='mail u1@example.com, see http://example.com/#Django')
+
+
+    def setUp(self):
+        cache.clear()
+        # log in user 1
+        u1 = User.objects.get(pk=1)
+        client.force_login(u1)
+
+
+    def tearDown(self):
+        client.logout()
+
+
+    def test_tags_and_mentions_are_extracted(self):
+        self.assertEqual(list(Hashtag.objects.values_list('name', flat=True)), ['django'])
+        self.assertEqual(PostTag.objects.count(), 12)
+        self.assertEqual(Mention.objects.filter(user__username='u1').count(), 12)
+        self.assertFalse(Post.objects.get(pk=13).post_tags.exists())
+        self.assertFalse(Post.objects.get(pk=13).mentions.exists())
+
+
+    def test_edit_replaces_tags_and_mentions(self):
+        post = Post.objects.get(pk=1)
+        post.edit('now #python with @u2 and @nobody')
+        self.assertEqual([str(post_tag.tag) for post_tag in post.post_tags.all()], ['#python'])
+        self.assertEqual([mention.user.username for mention in post.mentions.all()], ['u2'])
+
+
+    def test_overlong_tag_is_dropped(self):
+        post = Post.objects.get(pk=1)
+        post.edit(f"#{'a' * 100} #{'b' * 101}")
+        self.assertEqual([str(post_tag.tag) for post_tag in post.post_tags.all()], [f"#{'a' * 100}"])
+
+
+    def test_tag_page(self):
+        response = client.get(reverse('tag', kwargs={'name': 'DJANGO'}))
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), 10)
+        self.assertEqual(page_obj[0].id, 12)
+        self.assertContains(response, '#DJANGO')
+
+        response = client.get(reverse('tag', kwargs={'name': 'DJANGO'}), {'cursor': page_obj.next_cursor})
+        self.assertEqual([post.id for post in response.context['page_obj']], [2, 1])
+
+
+    def test_unknown_tag_is_empty(self):
+        response = client.get(reverse('tag', kwargs={'name': 'unknown'}))
+        self.assertEqual(len(response.context['page_obj']), 0)
+        self.assertEqual(client.get(reverse('tag_feed', kwargs={'name': 'unknown'})).json()['posts'], [])
+
+
+    def test_mentions_feed(self):
+        data = client.get(reverse('mentions_feed')).json()
+        self.assertEqual(len(data['posts']), 10)
+        data = client.get(reverse('mentions_feed'), {'cursor': data['next']}).json()
+        self.assertEqual([post['id'] for post in data['posts']], [2, 1])
+
+        # nobody mentions user 2
+        client.force_login(User.objects.get(pk=2))
+        self.assertEqual(len(client.get(reverse('mentions')).context['page_obj']), 0)
+
+
+
+class SearchTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Create user
+        u1 = User.objects.create(username='u1')
+
+        # create 12 posts about cats, one of them mostly about cats, and one about dogs
+        for i in range(11):
+            Post.objects.create(created_by=u1, content=f'post {i} about a cat and other things')
+        Post.objects.create(created_by=u1, content='cat cat cat')
+        Post.objects.create(created_by=u1, content='dogs only')
+
+
+    def setUp(self):
+        cache.clear()
+
+
+    def test_search_ranks_and_pages(self):
+        response = client.get(reverse('search'), {'q': 'cat'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), 10)
+        self.assertEqual(page_obj[0].content, 'cat cat cat')
+
+        # pagination links keep the search
+        self.assertContains(response, f'?q=cat&amp;cursor={page_obj.next_cursor}')
+        response = client.get(reverse('search'), {'q': 'cat', 'cursor': page_obj.next_cursor})
+        self.assertEqual(len(response.context['page_obj']), 2)
+
+
+    def test_every_word_must_match(self):
+        data = client.get(reverse('search_feed'), {'q': 'cat dogs'}).json()
+        self.assertEqual(data['posts'], [])
+        data = client.get(reverse('search_feed'), {'q': 'dogs'}).json()
+        self.assertEqual([post['content'] for post in data['posts']], ['dogs only'])
+
+
+    def test_search_syntax_is_taken_literally(self):
+        for q in ['"', 'cat OR', 'NEAR(cat', '-cat', '*', '', '\x00', 'cat\x00dog\x1f']:
+            response = client.get(reverse('search_feed'), {'q': q})
+            self.assertEqual(response.status_code, 200)
+            response = client.get(reverse('search'), {'q': q})
+            self.assertEqual(response.status_code, 200)
+
+
+    def test_index_follows_edits_and_deletes(self):
+        post = Post.objects.get(content='dogs only')
+        post.edit('birds only')
+        self.assertFalse(Post.objects.search('dogs').exists())
+        self.assertTrue(Post.objects.search('birds').exists())
+
+        post.delete()
+        self.assertFalse(Post.objects.search('birds').exists())
+
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM network_post_fts')
+        self.assertFalse(Post.objects.search('cat').exists())
+
+        out = io.StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('13 posts indexed.', out.getvalue())
+        self.assertEqual(Post.objects.search('cat').count(), 12)
+
+
+
+class ThumbnailTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+
+        # Create user with a transparent 400x300 png and a post
+        image = io.BytesIO()
+        Image.new('RGBA', (400, 300), (255, 0, 0, 128)).save(image, 'PNG')
+        u1 = User.objects.create(username='u1')
+        u1.image = SimpleUploadedFile('me.png', image.getvalue(), content_type='image/png')
+        u1.save()
+        Post.objects.create(created_by=u1, content='abc')
+
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root)
+        super().tearDownClass()
+
+
+    def setUp(self):
+        cache.clear()
+
+
+    def test_variants_are_made_on_upload(self):
+        u1 = User.objects.get(pk=1)
+        self.assertTrue(thumbnails.has_variants(u1.image))
+        for size in thumbnails.SIZES.values():
+            with u1.image.storage.open(thumbnails.variant_name(u1.image.name, size)) as f:
+                self.assertEqual(Image.open(f).size, (size, size))
+
+
+    def test_pages_render_variants(self):
+        u1 = User.objects.get(pk=1)
+        response = client.get(reverse('profiles', kwargs={'user_id': 1}))
+        self.assertContains(response, f'src="{thumbnails.get_variant_url(u1.image, "large")}" width="160" height="160"')
+        self.assertContains(response, f'src="{thumbnails.get_variant_url(u1.image, "small")}" width="40" height="40"')
+        self.assertNotContains(response, f'src="{u1.image.url}"')
+
+
+    def test_other_saves_skip_thumbnails(self):
+        u1 = User.objects.get(pk=1)
+        u1.image.storage.delete(thumbnails.variant_name(u1.image.name, 40))
+        u1.save(update_fields=['last_login'])
+        self.assertFalse(thumbnails.has_variants(u1.image))
+
+        out = io.StringIO()
+        call_command('make_thumbnails', stdout=out)
+        self.assertIn('Thumbnails rendered for 1 images.', out.getvalue())
+        self.assertTrue(thumbnails.has_variants(u1.image))
+
+
+    def test_changed_image_gets_new_variants(self):
+        u2 = User.objects.create(username='u2')
+        storage = u2.image.storage
+        images = {}
+        for name, color in (('you.png', 'red'), ('you.jpg', 'blue')):
+            image = io.BytesIO()
+            Image.new('RGB', (50, 50), color).save(image, 'PNG' if name.endswith('png') else 'JPEG')
+            u2.image = SimpleUploadedFile(name, image.getvalue())
+            u2.save()
+            images[color] = u2.image.name
+        self.assertEqual(images['red'], 'images/you.png')
+        self.assertNotEqual(thumbnails.variant_name(images['red'], 40), thumbnails.variant_name(images['blue'], 40))
+        with storage.open(thumbnails.variant_name(images['blue'], 40)) as f:
+            self.assertGreater(Image.open(f).getpixel((20, 20))[2], 200)
+
+        # a new upload with the name of a deleted image does not get its variants, they may be cached
+        variant = thumbnails.variant_name(images['red'], 40)
+        with storage.open(variant) as f:
+            served = f.read()
+        storage.delete(images['red'])
+        image = io.BytesIO()
+        Image.new('RGB', (50, 50), 'green').save(image, 'PNG')
+        u2.image = SimpleUploadedFile('you.png', image.getvalue())
+        u2.save()
+        self.assertNotEqual(u2.image.name, images['red'])
+        self.assertTrue(thumbnails.has_variants(u2.image))
+        with storage.open(variant) as f:
+            self.assertEqual(f.read(), served)
+
+
+
+class QueryPlanTestCase(TestCase):
+    """ Checks that the queries of every view are served by indexes. """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Create users
+        users = [User.objects.create(username=f'u{i}') for i in range(1, 4)]
+        u1 = users[0]
+
+        # create posts, follows and likes
+        for user in users:
+            u1.follow(user)
+            for _ in range(15):
+                post = Post.objects.create(created_by=user, content='abc #abc @u1')
+                post.like(u1)
+
+
+    def setUp(self):
+        # log in user 1
+        u1 = User.objects.get(pk=1)
+        client.force_login(u1)
+
+
+    def tearDown(self):
+        client.logout()
+
+
+    def assertQueriesUseIndexes(self, url):
+        """ Runs EXPLAIN QUERY PLAN on every query of the request and fails on full scans or sorts. """
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        for query in context.captured_queries:
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {query["sql"]}')
+                plan = [row[-1] for row in cursor.fetchall()]
+            for step in plan:
+                self.assertIsNone(
+                    re.match(r'^SCAN \w+$', step), f'Full table scan in {url}: {query["sql"]}\n{plan}'
+                )
+                self.assertNotIn('TEMP B-TREE', step, f'Sort without index in {url}: {query["sql"]}\n{plan}')
+
+
+    def test_index_query_plans(self):
+        self.assertQueriesUseIndexes(reverse('index'))
+        cursor = client.get(reverse('index')).context['page_obj'].next_cursor
+        self.assertQueriesUseIndexes(f"{reverse('index')}?cursor={cursor}")
+
+
+    def test_following_query_plans(self):
+        self.assertQueriesUseIndexes(reverse('following'))
+        cursor = client.get(reverse('following')).context['page_obj'].next_cursor
+        self.assertQueriesUseIndexes(f"{reverse('following')}?cursor={cursor}")
+
+
+    def test_profile_query_plans(self):
+        self.assertQueriesUseIndexes(reverse('profiles', kwargs={'user_id': 2}))
+
+
+    def test_api_query_plans(self):
+        self.assertQueriesUseIndexes(reverse('post', kwargs={'post_id': 1}))
+        self.assertQueriesUseIndexes(reverse('follow', kwargs={'user_id': 2}))
+        self.assertQueriesUseIndexes(f"{reverse('follow_statuses')}?ids=2,3")
+        self.assertQueriesUseIndexes(reverse('likers', kwargs={'post_id': 1}))
+        self.assertQueriesUseIndexes(f"{reverse('posts')}?ids=1,2,3")
+        self.assertQueriesUseIndexes(reverse('following_feed'))
+
+
+    def test_tag_and_mention_query_plans(self):
+        self.assertQueriesUseIndexes(reverse('tag', kwargs={'name': 'abc'}))
+        cursor = client.get(reverse('tag', kwargs={'name': 'abc'})).context['page_obj'].next_cursor
+        self.assertQueriesUseIndexes(f"{reverse('tag', kwargs={'name': 'abc'})}?cursor={cursor}")
+        self.assertQueriesUseIndexes(reverse('mentions'))
+
+
+
+class CustomUserModelTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Create users
+        u1 = User.objects.create(username='u1')
+        u2 = User.objects.create(username='u2')
+        u3 = User.objects.create(username='u3')
+
+        # create posts
+        p1 = Post.objects.create(created_by=u1, content='abc')
+        p2 = Post.objects.create(created_by=u1, content='def')
+        p3 = Post.objects.create(created_by=u2, content='ghi')
+
+        # create follows
+        u1.following.add(u2)
+        u1.following.add(u3)
+        u2.following.add(u1)
+
+        # add likes
+        u1.liked_posts.add(p3)
+        u3.liked_posts.add(p1)
+        u3.liked_posts.add(p2)
+        u3.liked_posts.add(p3)
+
+
+    def test_create_user(self):
+        user = User.objects.create_user(
+            username='adam',
+            email='adam@email.com',
+            password='pwd123'
+        )
+        self.assertEqual(user.username, 'adam')
+        self.assertEqual(user.email, 'adam@email.com')
+        self.assertTrue(user.is_active)
+        self.assertFalse(user.is_staff)
+        self.assertFalse(user.is_superuser)
+
+
+    def test_create_superuser(self):
+        admin_user = User.objects.create_superuser(
+            username='superadmin',
+            email='superadmin@email.com',
+            password='test123'
+        )
+        self.assertEqual(admin_user.username, 'superadmin')
+        self.assertEqual(admin_user.email, 'superadmin@email.com')
+        self.assertTrue(admin_user.is_active)
+        self.assertTrue(admin_user.is_staff)
+        self.assertTrue(admin_user.is_superuser)
+
+
+    def test_likes_count(self):
+        u1 = User.objects.get(username='u1')
+        u2 = User.objects.get(username='u2')
+        u3 = User.objects.get(username='u3')
+
+        self.assertEqual(u1.liked_posts.count(), 1)     
+        self.assertEqual(u2.liked_posts.count(), 0)     
+        self.assertEqual(u3.liked_posts.count(), 3)     
+
+
+    def test_posts_count(self):
+        u1 = User.objects.get(username='u1')
+        u2 = User.objects.get(username='u2')
+        u3 = User.objects.get(username='u3')
+
+        self.assertEqual(Post.objects.all().count(), 3)
+        self.assertEqual(u1.posts.count(), 2)
+        self.assertEqual(u2.posts.count(), 1)
+        self.assertEqual(u3.posts.count(), 0)
+
+
+    def test_follows_count(self):
+        u1 = User.objects.get(username='u1')
+        u2 = User.objects.get(username='u2')
+        u3 = User.objects.get(username='u3')
+
+        self.assertEqual(u1.followed_by.count(), 1)
+        self.assertEqual(u2.followed_by.count(), 1)
+        self.assertEqual(u3.followed_by.count(), 1)
+
+        self.assertEqual(u1.following.count(), 2)
+        self.assertEqual(u2.following.count(), 1)
+        self.assertEqual(u3.following.count(), 0)
+
+
+    def test_get_posts_of_followed_people(self):
+        u1 = User.objects.get(username='u1')
+        u2 = User.objects.get(username='u2')
+        u3 = User.objects.get(username='u3')
+
+        p1 = Post.objects.get(pk=1)
+        p2 = Post.objects.get(pk=2)
+        p3 = Post.objects.get(pk=3)
+
+        posts1 = u1.get_posts_of_followed_people()
+        self.assertEqual(len(posts1), 1)
+        self.assertIn(p3, posts1)
+        
+        posts2 = u2.get_posts_of_followed_people()
+        self.assertEqual(len(posts2), 2)
+
+        self.assertIn(p1, posts2)
+        self.assertIn(p2, posts2)
+        
+        posts3 = u3.get_posts_of_followed_people()
+        self.assertEqual(len(posts3), 0)
+
+
+
+class PostModelTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Create users
+        u1 = User.objects.create(username='u1')
+        u2 = User.objects.create(username='u2')
+        u3 = User.objects.create(username='u3')
+
+        # create posts
+        p1 = Post.objects.create(created_by=u1, content='abc')
+        p2 = Post.objects.create(created_by=u1, content='def')
+        p3 = Post.objects.create(created_by=u2, content='ghi')
+
+        # add likes
+        u1.liked_posts.add(p3)
+        u3.liked_posts.add(p1)
+        u3.liked_posts.add(p2)
+        u3.liked_posts.add(p3)
+
+
+    def test_text_content(self):
+        p1 = Post.objects.get(id=1)
+        p2 = Post.objects.get(id=2)
+        p3 = Post.objects.get(id=3)
+        
+        content1 = f'{p1.content}'
+        content2 = f'{p2.content}'
+        content3 = f'{p3.content}'
+        
+        self.assertEqual(content1, 'abc')
+        self.assertEqual(content2, 'def')
+        self.assertEqual(content3, 'ghi')
+
+
+    def test_likes_count(self):
+
+        p1 = Post.objects.get(id=1)
+        p2 = Post.objects.get(id=2)
+        p3 = Post.objects.get(id=3)  
+        
+        self.assertEqual(p1.liked_by.count(), 1)     
+        self.assertEqual(p2.liked_by.count(), 1)     
+        self.assertEqual(p3.liked_by.count(), 2)     
+
+
+    def test_get_all_posts(self):
+
+        p1 = Post.objects.get(pk=1)
+        p2 = Post.objects.get(pk=2)
+        p3 = Post.objects.get(pk=3)
+
+        all_posts = Post.get_all_posts()
+
+        self.assertEqual(len(all_posts), 3)
+        self.assertIn(p1, all_posts)
+        self.assertIn(p2, all_posts)
+        self.assertIn(p3, all_posts)
+
+
+
+class TimelineTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Create users
+        u1 = User.objects.create(username='u1')
+        u2 = User.objects.create(username='u2')
+        u3 = User.objects.create(username='u3')
+
+        # create posts before follow
+        Post.objects.create(created_by=u2, content='abc')
+        Post.objects.create(created_by=u3, content='def')
+
+
+    def test_follow_backfills_timeline(self):
+        u1 = User.objects.get(username='u1')
+        u2 = User.objects.get(username='u2')
+
+        u1.follow(u2)
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(user=u1).values_list('post__content', flat=True)),
+            ['abc']
+        )
+
+
+    def test_new_post_fans_out_to_followers(self):
+        u1 = User.objects.get(username='u1')
+        u2 = User.objects.get(username='u2')
+        u3 = User.objects.get(username='u3')
+
+        u1.follow(u2)
+        u3.follow(u2)
+        p = Post.objects.create(created_by=u2, content='ghi')
+
+        self.assertTrue(TimelineEntry.objects.filter(user=u1, post=p).exists())
+        self.assertTrue(TimelineEntry.objects.filter(user=u3, post=p).exists())
+        self.assertFalse(TimelineEntry.objects.filter(user=u2, post=p).exists())
+        self.assertEqual(u1.get_posts_of_followed_people()[0], p)
+
+
+    def test_unfollow_prunes_timeline(self):
+        u1 = User.objects.get(username='u1')
+        u2 = User.objects.get(username='u2')
+        u3 = User.objects.get(username='u3')
+
+        u1.follow(u2)
+        u1.follow(u3)
+        self.assertEqual(u1.get_posts_of_followed_people().count(), 2)
+
+        u1.unfollow(u2)
+        posts = u1.get_posts_of_followed_people()
+        self.assertEqual(len(posts), 1)
+        self.assertEqual(posts[0].created_by, u3)
+
+
+    def test_clear_prunes_timeline(self):
+        u1 = User.objects.get(username='u1')
+        u2 = User.objects.get(username='u2')
+        u3 = User.objects.get(username='u3')
+
+        u1.following.add(u2, u3)
+        u1.following.clear()
+        self.assertFalse(TimelineEntry.objects.filter(user=u1).exists())
+
+
+
+class BenchmarkTestCase(TestCase):
+
+    def test_generate_social_graph(self):
+        call_command('generate_social_graph', users=50, posts=300, follows=5, likes=3, tags=10, stdout=io.StringIO())
+        self.assertEqual(User.objects.count(), 50)
+        self.assertEqual(Post.objects.count(), 300)
+
+        # counters, timelines, tags and the search index are consistent with the relations
+        Follow = User.followed_by.through
+        self.assertEqual(sum(User.objects.values_list('followers_count', flat=True)), Follow.objects.count())
+        self.assertEqual(sum(Post.objects.values_list('likes_count', flat=True)), Post.liked_by.through.objects.count())
+        follow = Follow.objects.first()
+        self.assertEqual(
+            TimelineEntry.objects.filter(user_id=follow.to_user_id, post__created_by_id=follow.from_user_id).count(),
+            Post.objects.filter(created_by_id=follow.from_user_id).count()
+        )
+        post_tag = PostTag.objects.select_related('post', 'tag').first()
+        self.assertIn(f'#{post_tag.tag.name}', post_tag.post.content)
+        self.assertEqual(Post.objects.search('the').count(), Post.objects.filter(content__regex=r'\bthe\b').count())
+
+        # usernames are taken
+        with self.assertRaises(CommandError):
+            call_command('generate_social_graph', users=5, posts=5, stdout=io.StringIO())
+
+
+    def test_benchmark_covers_every_route(self):
+        sample = {'post_ids': [1], 'user_ids': [1], 'tags': ['abc'], 'words': ['abc']}
+        routes, writes = get_routes(sample)
+        self.assertEqual({pattern.name for pattern in urls.urlpatterns} - set(routes), SKIPPED)
+        for method, make_request in [*routes.values(), *writes.values()]:
+            url, _ = make_request(random.Random(0))
+            resolve(url.split('?')[0])
+
+
+
+class CounterTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Create users
+        u1 = User.objects.create(username='u1')
+        u2 = User.objects.create(username='u2')
+
+        # create posts
+        Post.objects.create(created_by=u1, content='abc')
+        Post.objects.create(created_by=u1, content='def')
+
+
+    def test_posts_counter(self):
+        u1 = User.objects.get(username='u1')
+        u2 = User.objects.get(username='u2')
+        self.assertEqual(u1.posts_count, 2)
+        self.assertEqual(u2.posts_count, 0)
+
+
+    def test_likes_counter(self):
+        p1 = Post.objects.get(content='abc')
+        u1 = User.objects.get(username='u1')
+        u2 = User.objects.get(username='u2')
+
+        self.assertTrue(p1.like(u1))
+        self.assertTrue(p1.like(u2))
+        self.assertFalse(p1.like(u2))
+        p1.refresh_from_db()
+        self.assertEqual(p1.likes_count, 2)
+
+        self.assertTrue(p1.unlike(u2))
+        self.assertFalse(p1.unlike(u2))
+        p1.refresh_from_db()
+        self.assertEqual(p1.likes_count, 1)
+
+
+    def test_follow_counters(self):
+        u1 = User.objects.get(username='u1')
+        u2 = User.objects.get(username='u2')
+
+        u1.follow(u2)
+        u1.follow(u2)
+        u1.refresh_from_db()
+        u2.refresh_from_db()
+        self.assertEqual(u1.following_count, 1)
+        self.assertEqual(u2.followers_count, 1)
+
+        u1.unfollow(u2)
+        u1.unfollow(u2)
+        u1.refresh_from_db()
+        u2.refresh_from_db()
+        self.assertEqual(u1.following_count, 0)
+        self.assertEqual(u2.followers_count, 0)
+
+
+    def test_counters_of_managers(self):
+        p1 = Post.objects.get(content='abc')
+        u1 = User.objects.get(username='u1')
+        u2 = User.objects.get(username='u2')
+
+        # e.g. the widgets of the admin
+        u1.following.add(u2)
+        u2.followed_by.add(u1)
+        p1.liked_by.add(u1, u2)
+        u2.liked_posts.add(p1)
+        u1.refresh_from_db()
+        u2.refresh_from_db()
+        p1.refresh_from_db()
+        self.assertEqual((u1.following_count, u2.followers_count, p1.likes_count), (1, 1, 2))
+
+        # the API removes what the managers added
+        client.force_login(u1)
+        response = client.put(reverse('follow', kwargs={'user_id': 2}), {'isfollowing': False}, content_type='application/json')
+        self.assertEqual(response.status_code, 204)
+        response = client.put(reverse('post', kwargs={'post_id': p1.id}), {'liking': False}, content_type='application/json')
+        self.assertEqual(response.status_code, 204)
+        client.logout()
+
+        # removing what is not there changes nothing
+        u1.following.remove(u2)
+        u2.liked_posts.clear()
+        p1.liked_by.remove(u1)
+        u1.refresh_from_db()
+        u2.refresh_from_db()
+        p1.refresh_from_db()
+        self.assertEqual((u1.following_count, u2.followers_count, p1.likes_count), (0, 0, 0))
+
+
+    def test_recount_command(self):
+        p1 = Post.objects.get(content='abc')
+        u1 = User.objects.get(username='u1')
+        u2 = User.objects.get(username='u2')
+
+        # counters out of line with the relations
+        p1.liked_by.add(u1, u2)
+        u2.following.add(u1)
+        Post.objects.update(likes_count=0)
+        User.objects.update(posts_count=0, followers_count=0, following_count=0)
+
+        call_command('recount_counters', stdout=io.StringIO())
+        p1.refresh_from_db()
+        u1.refresh_from_db()
+        u2.refresh_from_db()
+        self.assertEqual(p1.likes_count, 2)
+        self.assertEqual(u1.posts_count, 2)
+        self.assertEqual(u1.followers_count, 1)
+        self.assertEqual(u2.following_count, 1)
+
+
+
+class PostAPITestCase(TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Create user
+        u1 = User.objects.create(username='u1')
+        u2 = User.objects.create(username='u2')
+
+        # create posts
+        p1 = Post.objects.create(
+            created_by=u1,
+            content='abc'
+        )
+        p2 = Post.objects.create(created_by=u2)
+
+        # add likes
+        p1.like(u2)
+
+        # Create PUT payloads
+        cls.payload_change_content = {
+            'post_content': 'def',
+        }
+        cls.payload_like = {
+            'liking': True,
+        }
+        cls.payload_unlike = {
+            'liking': False,
+        }
+
+
+    def setUp(self):
+        # log in user 1
+        u1 = User.objects.get(pk=1)
+        client.force_login(u1)
+
+
+    def tearDown(self):
+        client.logout()
+
+
+    def test_get_existing_post(self):
+
+        p1 = Post.objects.get(pk=1)
+        u2 = User.objects.get(pk=2)
+
+        response = client.get(reverse('post', kwargs={'post_id': p1.id}))
+        data = response.json()
+        self.assertEqual(data['id'], 1)
+        self.assertEqual(data['content'], 'abc')
+        self.assertEqual(data['likes'], 1)
+        self.assertFalse(data['liked_by_me'])
+        self.assertEqual(response.status_code, 200)
+
+
+    def test_get_nonexisting_post_raises_error(self):
+
+        response = client.get(reverse('post', kwargs={'post_id': 99}))
+        data = response.json()
+        self.assertEqual(data['error'], "Post not found.")
+        self.assertEqual(response.status_code, 404)
+
+
+    def test_change_post_content(self):
+
+        p1 = Post.objects.get(pk=1)
+
+        # test content before request
+        self.assertEqual(p1.content, 'abc')
+
+        # put request
+        response = client.put(
+            reverse('post', kwargs={'post_id': p1.id}),
+            data=json.dumps(self.payload_change_content),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 204)
+        
+        # test content after request     
+        p1 = Post.objects.get(pk=1)   
+        self.assertEqual(p1.content, 'def')
+
+
+    def test_like_unlike(self):
+        p2 = Post.objects.get(pk=2)
+        u1 = User.objects.get(username='u1')
+
+        # test initial status
+        self.assertEqual(list(p2.liked_by.all()), [])
+
+        # like
+        response = client.put(
+            reverse('post', kwargs={'post_id': p2.id}),
+            data=json.dumps(self.payload_like),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 204)
+        p2 = Post.objects.get(pk=2)
+        self.assertEqual(list(p2.liked_by.all()), [u1])
+
+        # like again
         response = client.put(
             reverse('post', kwargs={'post_id': p2.id}),
             data=json.dumps(self.payload_like),
@@ -470,66 +1928,333 @@ class PostAPITestCase(TestCase):
         p2 = Post.objects.get(pk=2)
         self.assertEqual(list(p2.liked_by.all()), [u1])
 
-        # like again
-        response = client.put(
-            reverse('post', kwargs={'post_id': p2.id}),
-            data=json.dumps(self.payload_like),
-            content_type='application/json'
-        )
-        self.assertEqual(response.status_code, 204)
-        p2 = Post.objects.get(pk=2)
-        self.assertEqual(list(p2.liked_by.all()), [u1])
+        # unlike
+        response = client.put(
+            reverse('post', kwargs={'post_id': p2.id}),
+            data=json.dumps(self.payload_unlike),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 204)
+        p2 = Post.objects.get(pk=2)
+        self.assertEqual(list(p2.liked_by.all()), [])
+
+        # unlike again
+        response = client.put(
+            reverse('post', kwargs={'post_id': p2.id}),
+            data=json.dumps(self.payload_unlike),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 204)
+        p2 = Post.objects.get(pk=2)
+        self.assertEqual(list(p2.liked_by.all()), [])
+
+
+    def test_post_method_raises_error(self):
+
+        p1 = Post.objects.get(pk=1)
+
+        # put request
+        response = client.post(
+            reverse('post', kwargs={'post_id': p1.id}),
+            data=json.dumps(self.payload_change_content),
+            content_type='application/json'
+        )
+        data = response.json()
+        self.assertEqual(data['error'], "GET or PUT request required.")
+        self.assertEqual(response.status_code, 400)
+
+
+    def test_request_denied_for_non_authenticated_user(self):
+        client.logout()
+        
+        p1 = Post.objects.get(pk=1)
+
+        # put request
+        response = client.put(
+            reverse('post', kwargs={'post_id': p1.id}),
+            data=json.dumps(self.payload_change_content),
+            content_type='application/json'
+        )
+
+        # Make sure status code is 302: redirect to /accounts/login/?next=/following
+        self.assertEqual(response.status_code, 302)
+
+
+class FeedAPITestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Create users
+        u1 = User.objects.create(username='u1')
+        u2 = User.objects.create(username='u2')
+
+        # create posts and follows
+        for i in range(15):
+            Post.objects.create(created_by=u2, content=f'post {i}')
+        Post.objects.create(created_by=u1, content='own post')
+        u1.follow(u2)
+
+
+    def setUp(self):
+        # log in user 1
+        u1 = User.objects.get(pk=1)
+        client.force_login(u1)
+
+
+    def tearDown(self):
+        client.logout()
+
+
+    def test_feed_pages(self):
+        response = client.get(reverse('feed'))
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['posts']), 10)
+        self.assertEqual(data['posts'][0]['content'], 'own post')
+        self.assertIsNone(data['previous'])
+
+        data = client.get(reverse('feed'), {'cursor': data['next']}).json()
+        self.assertEqual(len(data['posts']), 6)
+        self.assertIsNone(data['next'])
+        self.assertIsNotNone(data['previous'])
+
+
+    def test_following_feed(self):
+        data = client.get(reverse('following_feed')).json()
+        self.assertEqual(len(data['posts']), 10)
+        data = client.get(reverse('following_feed'), {'cursor': data['next']}).json()
+        self.assertEqual(len(data['posts']), 5)
+        self.assertNotIn('own post', [post['content'] for post in data['posts']])
+
+
+    def test_profile_feed(self):
+        data = client.get(reverse('profile_feed', kwargs={'user_id': 1})).json()
+        self.assertEqual([post['content'] for post in data['posts']], ['own post'])
+        self.assertIsNone(data['next'])
+
+
+    def test_feed_query_count(self):
+        # page of posts
+        with self.assertNumQueries(1):
+            client.get(reverse('feed'))
+
+
+    def test_get_posts_by_ids(self):
+        response = client.get(reverse('posts'), {'ids': '3,1,99'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([post['id'] for post in response.json()['posts']], [3, 1])
+
+
+    def test_get_posts_by_invalid_ids_raises_error(self):
+        response = client.get(reverse('posts'), {'ids': '1,a'})
+        self.assertEqual(response.json()['error'], "Invalid post ids.")
+        self.assertEqual(response.status_code, 400)
+
+        response = client.get(reverse('posts'), {'ids': '1,10000000000000000000000000000000'})
+        self.assertEqual(response.status_code, 400)
+
+
+    def test_get_posts_by_ids_anonymously(self):
+        client.logout()
+        response = client.get(reverse('posts'), {'ids': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['posts'][0]['liked_by_me'], False)
+
+        # creating posts still needs a login
+        response = client.post(reverse('posts'), json.dumps({'post_content': 'Test'}), content_type='application/json')
+        self.assertEqual(response.status_code, 302)
+
+
+
+class LikersAPITestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
 
-        # unlike
-        response = client.put(
-            reverse('post', kwargs={'post_id': p2.id}),
-            data=json.dumps(self.payload_unlike),
-            content_type='application/json'
-        )
-        self.assertEqual(response.status_code, 204)
-        p2 = Post.objects.get(pk=2)
-        self.assertEqual(list(p2.liked_by.all()), [])
+        # Create users
+        users = [User.objects.create(username=f'u{i}') for i in range(1, 31)]
 
-        # unlike again
-        response = client.put(
-            reverse('post', kwargs={'post_id': p2.id}),
-            data=json.dumps(self.payload_unlike),
-            content_type='application/json'
-        )
-        self.assertEqual(response.status_code, 204)
-        p2 = Post.objects.get(pk=2)
-        self.assertEqual(list(p2.liked_by.all()), [])
+        # create post liked by everyone
+        post = Post.objects.create(created_by=users[0], content='abc')
+        for user in users:
+            post.like(user)
 
 
-    def test_post_method_raises_error(self):
+    def setUp(self):
+        # log in user 1
+        u1 = User.objects.get(pk=1)
+        client.force_login(u1)
 
-        p1 = Post.objects.get(pk=1)
 
-        # put request
-        response = client.post(
-            reverse('post', kwargs={'post_id': p1.id}),
-            data=json.dumps(self.payload_change_content),
-            content_type='application/json'
-        )
-        data = response.json()
-        self.assertEqual(data['error'], "GET or PUT request required.")
-        self.assertEqual(response.status_code, 400)
+    def tearDown(self):
+        client.logout()
 
 
-    def test_request_denied_for_non_authenticated_user(self):
+    def test_serialize_has_constant_size(self):
+        data = client.get(reverse('post', kwargs={'post_id': 1})).json()
+        self.assertEqual(data['likes'], 30)
+        self.assertTrue(data['liked_by_me'])
+        self.assertNotIn('liked_by', data)
+
+
+    def test_likers_pages(self):
+        data = client.get(reverse('likers', kwargs={'post_id': 1})).json()
+        self.assertEqual(len(data['likers']), 20)
+        self.assertEqual(data['likers'][0]['username'], 'u30')
+
+        data = client.get(reverse('likers', kwargs={'post_id': 1}), {'cursor': data['next']}).json()
+        self.assertEqual(len(data['likers']), 10)
+        self.assertEqual(data['likers'][-1], {'id': 1, 'username': 'u1'})
+        self.assertIsNone(data['next'])
+
+
+    def test_likers_non_finite_cursor_returns_first_page(self):
+        for values in ('[Infinity]', '[NaN]', '[-1e400]', '[100000000000000000000]'):
+            cursor = base64.urlsafe_b64encode(f'{{"d": "next", "k": {values}}}'.encode()).decode()
+            response = client.get(reverse('likers', kwargs={'post_id': 1}), {'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['likers'][0]['username'], 'u30')
+
+
+    def test_likers_of_nonexisting_post_raises_error(self):
+        response = client.get(reverse('likers', kwargs={'post_id': 99}))
+        self.assertEqual(response.json()['error'], "Post not found.")
+        self.assertEqual(response.status_code, 404)
+
+
+
+@override_settings(LIKE_BUFFER_INTERVAL=3600)
+class LikeBufferTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Create users
+        u1 = User.objects.create(username='u1')
+        u2 = User.objects.create(username='u2')
+
+        # create post of user 2 already liked by user 2
+        post = Post.objects.create(created_by=u2, content='abc')
+        post.like(u2)
+
+
+    def setUp(self):
+        # every test gets an empty buffer, flushed by hand
+        likes.like_buffer = None
+        u1 = User.objects.get(pk=1)
+        client.force_login(u1)
+
+
+    def tearDown(self):
         client.logout()
-        
-        p1 = Post.objects.get(pk=1)
+        likes.like_buffer = None
 
-        # put request
-        response = client.put(
-            reverse('post', kwargs={'post_id': p1.id}),
-            data=json.dumps(self.payload_change_content),
-            content_type='application/json'
+
+    def put_liking(self, liking):
+        client.put(
+            reverse('post', kwargs={'post_id': 1}), json.dumps({'liking': liking}), content_type='application/json'
         )
 
-        # Make sure status code is 302: redirect to /accounts/login/?next=/following
-        self.assertEqual(response.status_code, 302)
+
+    def test_toggles_are_deferred(self):
+        self.put_liking(True)
+        post = Post.objects.get(pk=1)
+        self.assertEqual(post.likes_count, 1)
+        self.assertEqual(post.liked_by.count(), 1)
+
+
+    def test_reads_include_pending_toggles(self):
+        self.put_liking(True)
+        data = client.get(reverse('post', kwargs={'post_id': 1})).json()
+        self.assertEqual(data['likes'], 2)
+        self.assertTrue(data['liked_by_me'])
+
+        data = client.get(reverse('feed')).json()
+        self.assertEqual(data['posts'][0]['likes'], 2)
+        self.assertTrue(data['posts'][0]['liked_by_me'])
+
+
+    def test_flush_writes_last_toggle(self):
+        for liking in (True, False, True):
+            self.put_liking(liking)
+        self.assertEqual(likes.like_buffer.pending, {(1, 1): True})
+
+        with self.assertNumQueries(4):
+            likes.like_buffer.flush()
+        post = Post.objects.get(pk=1)
+        self.assertEqual(post.likes_count, 2)
+        self.assertEqual(set(post.liked_by.values_list('username', flat=True)), {'u1', 'u2'})
+        self.assertEqual(post.version, 3)
+
+
+    def test_toggles_restoring_stored_state_cancel_out(self):
+        self.put_liking(True)
+        self.put_liking(False)
+        self.assertEqual(likes.like_buffer.pending, {})
+
+        with self.assertNumQueries(0):
+            likes.like_buffer.flush()
+
+
+    def test_flush_unlikes(self):
+        u2 = User.objects.get(pk=2)
+        client.force_login(u2)
+        self.put_liking(False)
+        likes.like_buffer.flush()
+
+        post = Post.objects.get(pk=1)
+        self.assertEqual(post.likes_count, 0)
+        self.assertFalse(post.liked_by.exists())
+
+
+    def test_toggles_during_flush_are_kept(self):
+        self.put_liking(True)
+        write = writer.write
+
+        def unlike_while_writing(func, *args):
+            # the stored state does not have the in-flight like yet
+            self.put_liking(False)
+            return write(func, *args)
+
+        with mock.patch.object(writer, 'write', side_effect=unlike_while_writing):
+            likes.like_buffer.flush()
+        self.assertEqual(likes.like_buffer.pending, {(1, 1): False})
+        data = client.get(reverse('post', kwargs={'post_id': 1})).json()
+        self.assertEqual(data['likes'], 1)
+        self.assertFalse(data['liked_by_me'])
+
+        likes.like_buffer.flush()
+        self.assertEqual(Post.objects.get(pk=1).likes_count, 1)
+        self.assertFalse(Post.objects.get(pk=1).liked_by.filter(pk=1).exists())
+
+
+    def test_failed_flush_keeps_newer_toggles(self):
+        self.put_liking(True)
+        buffer = likes.like_buffer
+        u2 = User.objects.get(pk=2)
+
+        def toggle_and_fail(func, *args):
+            # undoes the in-flight like of u1, unlikes for u2
+            buffer.toggle(Post.objects.get(pk=1), User.objects.get(pk=1), False, False)
+            buffer.toggle(Post.objects.get(pk=1), u2, False, True)
+            raise IntegrityError('failed')
+
+        with mock.patch.object(writer, 'write', side_effect=toggle_and_fail), self.assertLogs('network.likes'):
+            buffer.flush()
+        self.assertEqual(buffer.pending, {(1, 2): False})
+        self.assertEqual(buffer.in_flight, {})
+
+
+    @override_settings(LIKE_BUFFER_INTERVAL=0)
+    def test_disabled_buffer_writes_at_once(self):
+        self.put_liking(True)
+        self.assertIsNone(likes.like_buffer)
+        self.assertEqual(Post.objects.get(pk=1).likes_count, 2)
+
 
 
 class CreatePostAPITestCase(TestCase):
@@ -615,6 +2340,139 @@ class CreatePostAPITestCase(TestCase):
 
 
 
+class WriterTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Create user
+        User.objects.create(username='u1')
+
+
+    def test_connections_wait_for_the_write_lock(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+            # every commit is synced to disk (FULL), the default
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+
+    def test_batch_is_committed_together(self):
+        u1 = User.objects.get(pk=1)
+        batch = [(Future(), Post.objects.create, (), {'created_by': u1, 'content': str(i)}) for i in range(3)]
+
+        with CaptureQueriesContext(connection) as queries:
+            writer.write_batch(batch)
+        self.assertEqual(Post.objects.count(), 3)
+        self.assertEqual([future.result().content for future, *_ in batch], ['0', '1', '2'])
+        # one transaction (a savepoint in tests) around the savepoints of the writes
+        self.assertEqual(len([q for q in queries.captured_queries if q['sql'].startswith('SAVEPOINT')]), 4)
+
+
+    def test_failing_write_does_not_undo_the_others(self):
+        u1 = User.objects.get(pk=1)
+        batch = [
+            (Future(), Post.objects.create, (), {'created_by': u1, 'content': 'a'}),
+            (Future(), Post.objects.create, (), {'created_by': u1, 'content': None}),
+            (Future(), Post.objects.create, (), {'created_by': u1, 'content': 'c'}),
+        ]
+        writer.write_batch(batch)
+
+        self.assertEqual(set(Post.objects.values_list('content', flat=True)), {'a', 'c'})
+        self.assertIsNotNone(batch[1][0].exception())
+
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], ANONYMOUS_PAGE_CACHE_TIMEOUT=0)
+class ReplicaRouterTestCase(TransactionTestCase):
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.u1 = User.objects.create(username='replica')
+        Post.objects.create(created_by=self.u1, content='abc')
+
+
+    def tearDown(self):
+        client.logout()
+        client.cookies.pop(PIN_COOKIE, None)
+
+
+    def test_reads_go_to_replica(self):
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            with CaptureQueriesContext(connection) as primary_queries:
+                response = client.get(reverse('index'))
+        self.assertContains(response, 'abc')
+        self.assertGreater(len(replica_queries), 0)
+        self.assertEqual(len(primary_queries), 0)
+
+
+    def test_writes_and_transactions_use_primary(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_write(Post), 'default')
+        self.assertEqual(router.db_for_read(Post), 'replica')
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Post), 'default')
+
+
+    def test_writer_reads_from_primary_for_a_while(self):
+        client.force_login(self.u1)
+        response = client.post(reverse('posts'), json.dumps({'post_content': 'def'}), content_type='application/json')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = client.get(reverse('index'))
+        self.assertContains(response, 'def')
+        self.assertEqual(len(replica_queries), 0)
+
+
+    @override_settings(USER_CACHE_TIMEOUT=300)
+    def test_cached_user_comes_from_primary(self):
+        backend = backends.CachedModelBackend()
+        for get_user in (backend.get_user, async_to_sync(backend.aget_user)):
+            cache.clear()
+            with CaptureQueriesContext(connections['replica']) as replica_queries:
+                with CaptureQueriesContext(connection) as primary_queries:
+                    self.assertEqual(get_user(self.u1.pk), self.u1)
+            self.assertEqual(len(replica_queries), 0)
+            self.assertEqual(len(primary_queries), 1)
+
+
+
+@override_settings(WRITE_QUEUE=True)
+class WriteQueueTestCase(TransactionTestCase):
+
+    def setUp(self):
+        writer.writer = None
+        self.u1 = User.objects.create(username='writer')
+        client.force_login(self.u1)
+
+
+    def tearDown(self):
+        client.logout()
+        writer.writer = None
+
+
+    def test_writes_run_on_writer_thread(self):
+        threads = []
+        writer.write(lambda: threads.append(threading.current_thread()))
+        self.assertEqual(threads, [writer.writer.thread])
+
+
+    def test_create_post_through_queue(self):
+        response = client.post(reverse('posts'), json.dumps({'post_content': 'Test'}), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(User.objects.get(pk=self.u1.pk).posts_count, 1)
+
+
+    def test_errors_reach_the_caller(self):
+        with self.assertRaises(IntegrityError):
+            writer.write(Post.objects.create, created_by=self.u1, content=None)
+
+
+
 class FollowAPITestCase(TestCase):
 
     @classmethod
@@ -744,6 +2602,151 @@ class FollowAPITestCase(TestCase):
 
 
 
+class FollowStatusesAPITestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Create users
+        u1 = User.objects.create(username='u1')
+        u2 = User.objects.create(username='u2')
+        u3 = User.objects.create(username='u3')
+
+        # create follows
+        u1.follow(u2)
+
+
+    def setUp(self):
+        # log in user 1
+        u1 = User.objects.get(pk=1)
+        client.force_login(u1)
+
+
+    def tearDown(self):
+        client.logout()
+
+
+    def test_get_statuses(self):
+        response = client.get(reverse('follow_statuses'), {'ids': '2,3,99'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['isfollowing'], {'2': True, '3': False, '99': False})
+
+
+    def test_get_statuses_uses_one_query(self):
+        u1 = User.objects.get(pk=1)
+        with self.assertNumQueries(1):
+            self.assertEqual(u1.get_followed_ids([2, 3]), {2})
+        with self.assertNumQueries(1):
+            self.assertTrue(u1.is_following(User(pk=2)))
+
+
+    def test_invalid_ids_raise_error(self):
+        response = client.get(reverse('follow_statuses'), {'ids': '2,abc'})
+        self.assertEqual(response.json()['error'], "Invalid user ids.")
+        self.assertEqual(response.status_code, 400)
+
+        response = client.get(reverse('follow_statuses'), {'ids': '2,10000000000000000000000000000000'})
+        self.assertEqual(response.json()['error'], "Invalid user ids.")
+        self.assertEqual(response.status_code, 400)
+
+
+    def test_put_method_raises_error(self):
+        response = client.put(reverse('follow_statuses'))
+        self.assertEqual(response.json()['error'], "GET request required.")
+        self.assertEqual(response.status_code, 400)
+
+
+
+class AsyncAPITestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Create users
+        u1 = User.objects.create(username='u1')
+        u2 = User.objects.create(username='u2')
+
+        # create post
+        Post.objects.create(created_by=u2, content='abc')
+
+
+    def setUp(self):
+        # log in user 1
+        self.client = AsyncClient()
+        self.client.force_login(User.objects.get(pk=1))
+
+
+    async def test_get_post(self):
+        response = await self.client.get(reverse('async_post', kwargs={'post_id': 1}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['content'], 'abc')
+
+        response = await self.client.get(reverse('async_post', kwargs={'post_id': 99}))
+        self.assertEqual(response.status_code, 404)
+
+
+    async def test_like_post(self):
+        response = await self.client.put(
+            reverse('async_post', kwargs={'post_id': 1}),
+            data=json.dumps({'liking': True}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 204)
+        post = await Post.objects.aget(pk=1)
+        self.assertEqual(post.likes_count, 1)
+
+
+    async def test_edit_post_of_another_user_is_denied(self):
+        response = await self.client.put(
+            reverse('async_post', kwargs={'post_id': 1}),
+            data=json.dumps({'post_content': 'def'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+    async def test_create_post(self):
+        response = await self.client.post(
+            reverse('async_posts'),
+            data=json.dumps({'post_content': 'Test'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((await User.objects.aget(pk=1)).posts_count, 1)
+
+
+    async def test_follow(self):
+        url = reverse('async_follow', kwargs={'user_id': 2})
+        response = await self.client.put(url, data=json.dumps({'isfollowing': True}), content_type='application/json')
+        self.assertEqual(response.status_code, 204)
+
+        response = await self.client.get(url)
+        self.assertTrue(response.json()['isfollowing'])
+        response = await self.client.get(reverse('async_follow_statuses'), {'ids': '2,3'})
+        self.assertEqual(response.json()['isfollowing'], {'2': True, '3': False})
+
+
+    async def test_request_denied_for_non_authenticated_user(self):
+        await self.client.alogout()
+        response = await self.client.get(reverse('async_post', kwargs={'post_id': 1}))
+        self.assertEqual(response.status_code, 302)
+
+
+    async def test_get_posts_by_ids_anonymously(self):
+        await self.client.alogout()
+        response = await self.client.get(reverse('async_posts'), {'ids': '1,99'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([post['id'] for post in response.json()['posts']], [1])
+
+        response = await self.client.post(
+            reverse('async_posts'), data=json.dumps({'post_content': 'Test'}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 302)
+
+
+
 class ControlsTestCaseLoggedIn(LiveServerTestCase):
 
     @classmethod
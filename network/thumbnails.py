@@ -0,0 +1,70 @@
+"""
+Fixed-size variants of uploaded user images.
+
+The variants are square JPEGs stored next to the original, named after its
+full name, e.g. images/me.png -> images/me.png_160x160.jpg. They are made
+when a new image is saved (see signals.py), or by the make_thumbnails command
+for images uploaded before. Existing files are never overwritten, and uploads
+get a new name while a file or variants of that name exist, so the URLs of
+originals and variants never change their content and can be cached forever.
+"""
+import io
+import os
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+
+# variant name -> edge length in pixels
+SIZES = {
+    'small': 40,
+    'large': 160,
+}
+
+
+def variant_name(name, size):
+    return f'{name}_{size}x{size}.jpg'
+
+
+def upload_to(instance, filename):
+    """ Returns images/<filename>, renamed while variants of an earlier image with that name are left. """
+    storage = instance._meta.get_field('image').storage
+    name = storage.generate_filename(os.path.join('images', filename))
+    root, ext = os.path.splitext(name)
+    while any(storage.exists(variant_name(name, size)) for size in SIZES.values()):
+        name = storage.get_alternative_name(root, ext)
+    return name
+
+
+def get_variant_url(image, variant):
+    """ Returns the url of a variant of image, e.g. get_variant_url(user.image, 'small'). """
+    return image.storage.url(variant_name(image.name, SIZES[variant]))
+
+
+def has_variants(image):
+    return all(image.storage.exists(variant_name(image.name, size)) for size in SIZES.values())
+
+
+def make_variants(image):
+    """ Renders the missing sizes of image, cropped to a square around the center, and stores them next to the original. """
+    names = {size: variant_name(image.name, size) for size in SIZES.values()}
+    # a variant may have been served already, never change it
+    names = {size: name for size, name in names.items() if not image.storage.exists(name)}
+    if not names:
+        return
+
+    with image.open('rb') as f:
+        original = Image.open(f)
+        original = ImageOps.exif_transpose(original)
+        if original.mode != 'RGB':
+            # flatten transparency onto white, JPEG has no alpha channel
+            original = original.convert('RGBA')
+            background = Image.new('RGB', original.size, 'white')
+            background.paste(original, mask=original.getchannel('A'))
+            original = background
+
+    for size, name in names.items():
+        thumbnail = ImageOps.fit(original, (size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, 'JPEG', quality=85, optimize=True, progressive=True)
+        image.storage.save(name, ContentFile(buffer.getvalue()))
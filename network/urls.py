@@ -1,7 +1,7 @@
 
 from django.urls import path
 
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path("", views.index, name="index"),
@@ -10,10 +10,29 @@ urlpatterns = [
     path("logout", views.logout_view, name="logout"),
     path("register", views.register, name="register"),
     path("profiles/<int:user_id>", views.profiles, name="profiles"),
+    path("search", views.search, name="search"),
+    path("tags/<str:name>", views.tag, name="tag"),
+    path("mentions", views.mentions, name="mentions"),
+    path("slow-queries", views.slow_queries, name="slow_queries"),
 
     # API Routes
-    path("posts", views.create_post, name="posts"),
+    path("posts", views.posts, name="posts"),
     path("posts/<int:post_id>", views.post, name="post"), 
+    path("posts/<int:post_id>/likers", views.likers, name="likers"),
+    path("feed", views.feed, name="feed"),
+    path("feed/following", views.following_feed, name="following_feed"),
+    path("feed/profiles/<int:user_id>", views.profile_feed, name="profile_feed"),
+    path("feed/search", views.search_feed, name="search_feed"),
+    path("feed/tags/<str:name>", views.tag_feed, name="tag_feed"),
+    path("feed/mentions", views.mentions_feed, name="mentions_feed"),
+    path("follow", views.follow_statuses, name="follow_statuses"),
     path("follow/<int:user_id>", views.follow, name="follow"),
+    path("metrics", views.metrics_view, name="metrics"),
+
+    # Async API Routes (same as above, for ASGI servers)
+    path("async/posts", async_views.posts, name="async_posts"),
+    path("async/posts/<int:post_id>", async_views.post, name="async_post"),
+    path("async/follow", async_views.follow_statuses, name="async_follow_statuses"),
+    path("async/follow/<int:user_id>", async_views.follow, name="async_follow"),
 ]
 
@@ -1,25 +1,59 @@
+import hashlib
 import json
 
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required 
 from django.db import IntegrityError
 from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render
 from django.urls import reverse
-from django.core.paginator import Paginator
 
-from .models import User, Post
+from . import caching, likes, metrics, slowlog, writer
+from .models import User, Post, Hashtag
+from .pagination import CursorPaginator, paginate
+
+
+# cursor keys of posts read through the tag and mention tables
+TAG_KEYS = ('post_tags__created_time', 'post_tags__post')
+MENTION_KEYS = ('mentions__created_time', 'mentions__post')
 
 
 def index(request):
     """ Displays all posts plus button to add new post. """
+
+    # anonymous visitors all get the same page, serve it from the page cache
+    timeout = caching.get_page_cache_timeout()
+    if timeout and not request.user.is_authenticated:
+        content = caching.get_or_refresh(
+            caching.index_page_key(request),
+            caching.get_index_generation(),
+            lambda: render_index(request, get_index_page(request)).content,
+            timeout
+        )
+        etag = hashlib.md5(content).hexdigest()
+        return caching.conditional_response(request, etag, lambda: HttpResponse(content), private=False)
+
+    page_obj = get_index_page(request)
+    etag = caching.get_page_etag(request, page_obj)
+    return caching.conditional_response(
+        request, etag, lambda: render_index(request, page_obj), private=request.user.is_authenticated
+    )
+
+
+def get_index_page(request):
+    """ Returns the page of all posts requested by page number or cursor. """
     
     # get list of all posts and paginate (10 posts / page)
-    post_list = Post.get_all_posts()
-    paginator = Paginator(post_list, 10)
-    
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = Post.get_all_posts().feed(request.user)
+    page_obj = paginate(request, post_list)
+    likes.merge_pending(page_obj, request.user)
+    return page_obj
+
+
+def render_index(request, page_obj):
+    """ Renders a page of all posts. """
     return render(request, "network/index.html", {
         'page_obj': page_obj
     })
@@ -29,15 +63,54 @@ def index(request):
 def following(request):
     """ Displays posts of followed people plus button to add new post. """
     
-    # get list of filtered posts and paginate (10 posts / page)
-    post_list = request.user.get_posts_of_followed_people()
-    paginator = Paginator(post_list, 10)
-    
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return render(request, "network/index.html", {
+    # get list of filtered posts and paginate (10 posts / page) in timeline order
+    post_list = request.user.get_posts_of_followed_people().feed(request.user)
+    page_obj = paginate(request, post_list, keys=('timeline_entries__created_time', 'timeline_entries__post'))
+    likes.merge_pending(page_obj, request.user)
+
+    # answer 304 if the browser already has this page
+    etag = caching.get_page_etag(request, page_obj)
+    return caching.conditional_response(request, etag, lambda: render(request, "network/index.html", {
         'page_obj': page_obj
-    })
+    }))
+
+
+def tag(request, name):
+    """ Displays posts tagged with #name. """
+
+    # get list of tagged posts and paginate (10 posts / page), read from the tag index
+    page_obj = paginate(request, get_tagged_posts(name).feed(request.user), keys=TAG_KEYS)
+    likes.merge_pending(page_obj, request.user)
+
+    # answer 304 if the browser already has this page
+    etag = caching.get_page_etag(request, page_obj, name)
+    return caching.conditional_response(request, etag, lambda: render(request, "network/index.html", {
+        'heading': f'#{name}',
+        'page_obj': page_obj
+    }), private=request.user.is_authenticated)
+
+
+@login_required
+def mentions(request):
+    """ Displays posts mentioning the logged in user. """
+
+    # get list of posts mentioning the user and paginate (10 posts / page), read from the mention index
+    post_list = request.user.get_posts_mentioning().feed(request.user)
+    page_obj = paginate(request, post_list, keys=MENTION_KEYS)
+    likes.merge_pending(page_obj, request.user)
+
+    # answer 304 if the browser already has this page
+    etag = caching.get_page_etag(request, page_obj)
+    return caching.conditional_response(request, etag, lambda: render(request, "network/index.html", {
+        'heading': f'@{request.user.username}',
+        'page_obj': page_obj
+    }))
+
+
+def get_tagged_posts(name):
+    """ Returns posts tagged with #name in reversed order, none if the tag was never used. """
+    tag = Hashtag.objects.filter(name=name.lower()).first()
+    return tag.get_posts() if tag is not None else Post.objects.none()
 
 
 def login_view(request):
@@ -99,15 +172,36 @@ def profiles(request, user_id):
     p_user = User.objects.get(pk=user_id) 
 
     # get list of all posts of the user and paginate (10 posts / page)
-    post_list = Post.objects.filter(created_by=p_user).order_by('-created_time')
-    paginator = Paginator(post_list, 10)
-    
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return render(request, "network/profile.html", {
+    post_list = Post.objects.filter(created_by=p_user).order_by('-created_time').feed(request.user)
+    page_obj = paginate(request, post_list)
+    likes.merge_pending(page_obj, request.user)
+
+    # answer 304 if the browser already has this page
+    etag = caching.get_page_etag(
+        request, page_obj, p_user.id, p_user.username, p_user.image.name,
+        p_user.posts_count, p_user.followers_count, p_user.following_count
+    )
+    return caching.conditional_response(request, etag, lambda: render(request, "network/profile.html", {
         'p_user': p_user,
         'page_obj': page_obj
-    })
+    }), private=request.user.is_authenticated)
+
+
+def search(request):
+    """ Displays posts containing the words of ?q=, most relevant first. """
+    q = request.GET.get('q', '').strip()
+
+    # get matching posts and paginate (10 posts / page) by relevance
+    post_list = Post.objects.search(q).feed(request.user)
+    page_obj = CursorPaginator(post_list, 10, keys=('search_rank', 'id')).get_page(request.GET.get('cursor'))
+    likes.merge_pending(page_obj, request.user)
+
+    # answer 304 if the browser already has this page
+    etag = caching.get_page_etag(request, page_obj, q)
+    return caching.conditional_response(request, etag, lambda: render(request, "network/search.html", {
+        'page_obj': page_obj,
+        'q': q
+    }), private=request.user.is_authenticated)
 
 
 ##############
@@ -118,13 +212,13 @@ def profiles(request, user_id):
 def post(request, post_id):
     # Query for requested post
     try:
-        post = Post.objects.get(pk=post_id)
+        post = Post.objects.feed(request.user).get(pk=post_id)
     except Post.DoesNotExist:
         return JsonResponse({"error": "Post not found."}, status=404)
 
-    # Return post contents
+    # Return post contents, or 304 if the client already has this version
     if request.method == "GET":
-        return JsonResponse(post.serialize())
+        return post_response(request, post, request.user)
 
     # Update post data
     elif request.method == "PUT":
@@ -135,16 +229,10 @@ def post(request, post_id):
             if post.created_by != request.user:
                 return HttpResponse(status=403)
             else:
-                post.content = data["post_content"]
-                post.save()
+                writer.write(post.edit, data["post_content"])
         
         if data.get("liking") is not None:
-            liking = data["liking"]
-            if liking:
-                post.liked_by.add(request.user)
-            else:
-                post.liked_by.remove(request.user)
-            post.save()
+            likes.set_liking(post, request.user, bool(data["liking"]))
         
         return HttpResponse(status=204)
 
@@ -155,9 +243,125 @@ def post(request, post_id):
         }, status=400)
  
 
+@login_required
+def likers(request, post_id):
+    """ Returns a page of users who liked the post as JSON, latest likes first. """
+
+    # likers must be via GET
+    if request.method != "GET":
+        return JsonResponse({"error": "GET request required."}, status=400)
+
+    if not Post.objects.filter(pk=post_id).exists():
+        return JsonResponse({"error": "Post not found."}, status=404)
+
+    post_likes = Post.liked_by.through.objects.filter(post_id=post_id).select_related('user')
+    page_obj = CursorPaginator(post_likes, 20, keys=('id',)).get_page(request.GET.get('cursor'))
+    return JsonResponse({
+        'likers': [{'id': like.user.id, 'username': like.user.username} for like in page_obj],
+        'next': page_obj.next_cursor,
+        'previous': page_obj.previous_cursor
+    })
+
+
+def post_response(request, post, viewer):
+    """ Returns post of Post.objects.feed(viewer) as JSON, or 304 if the client already has this version. """
+    likes.merge_pending([post], viewer)
+    return caching.conditional_response(
+        request,
+        caching.get_post_etag(post),
+        lambda: JsonResponse(post.serialize()),
+        last_modified=int(post.modified_time.timestamp()) if post.modified_time else None
+    )
+
+
+def posts_response(post_ids, posts, viewer):
+    """ Returns posts ({id: post} of Post.objects.feed(viewer)) in the order of post_ids as JSON, unknown ids are left out. """
+    likes.merge_pending(posts.values(), viewer)
+    return JsonResponse({
+        'posts': [posts[post_id].serialize() for post_id in post_ids if post_id in posts]
+    })
+
+
+def get_ids(request, limit=100):
+    """ Returns the ids listed in ?ids=1,2,3 or None if they are not valid. """
+    try:
+        ids = [int(id) for id in request.GET.get('ids', '').split(',') if id]
+    except ValueError:
+        return None
+    # larger numbers overflow the integer parameters of SQLite
+    if len(ids) > limit or any(not -2**63 <= id < 2**63 for id in ids):
+        return None
+    return ids
+
+
+def feed_response(request, post_list, keys=('created_time', 'id')):
+    """ Returns a page of posts as JSON, with cursors to the neighbouring pages. """
+    page_obj = CursorPaginator(post_list, 10, keys).get_page(request.GET.get('cursor'))
+    likes.merge_pending(page_obj, request.user)
+
+    # answer 304 if the client already has this page
+    etag = caching.get_page_etag(request, page_obj, 'json')
+    return caching.conditional_response(request, etag, lambda: JsonResponse({
+        'posts': [post.serialize() for post in page_obj],
+        'next': page_obj.next_cursor,
+        'previous': page_obj.previous_cursor
+    }), private=request.user.is_authenticated)
+
+
+def feed(request):
+    """ Returns a page of all posts as JSON. """
+    return feed_response(request, Post.objects.feed(request.user))
+
+
+@login_required
+def following_feed(request):
+    """ Returns a page of posts of followed people as JSON. """
+    post_list = request.user.get_posts_of_followed_people().feed(request.user)
+    return feed_response(request, post_list, keys=('timeline_entries__created_time', 'timeline_entries__post'))
+
+
+def profile_feed(request, user_id):
+    """ Returns a page of posts of the given user as JSON. """
+    return feed_response(request, Post.objects.filter(created_by_id=user_id).feed(request.user))
+
+
+def search_feed(request):
+    """ Returns a page of posts containing the words of ?q= as JSON, most relevant first. """
+    post_list = Post.objects.search(request.GET.get('q', '')).feed(request.user)
+    return feed_response(request, post_list, keys=('search_rank', 'id'))
+
+
+def tag_feed(request, name):
+    """ Returns a page of posts tagged with #name as JSON. """
+    return feed_response(request, get_tagged_posts(name).feed(request.user), keys=TAG_KEYS)
+
+
+@login_required
+def mentions_feed(request):
+    """ Returns a page of posts mentioning the logged in user as JSON. """
+    return feed_response(request, request.user.get_posts_mentioning().feed(request.user), keys=MENTION_KEYS)
+
+
+def get_posts(request):
+    """ Returns the posts listed in ?ids=1,2,3 (at most 100) as JSON, unknown ids are left out. """
+    post_ids = get_ids(request)
+    if post_ids is None:
+        return JsonResponse({"error": "Invalid post ids."}, status=400)
+
+    posts = Post.objects.filter(id__in=post_ids).feed(request.user).in_bulk()
+    return posts_response(post_ids, posts, request.user)
+
+
+def posts(request):
+    """ Batch fetch of posts by ?ids= (GET, open to anonymous clients like the feeds) or new post (POST). """
+    if request.method == "GET" and 'ids' in request.GET:
+        return get_posts(request)
+    return create_post(request)
+
+
 @login_required
 def create_post(request):
-    
+
     # creating a new post must be via POST
     if request.method != "POST":
         return JsonResponse({"error": "POST request required."}, status=400)
@@ -170,12 +374,12 @@ def create_post(request):
             "error": "At least one character required."
         }, status=400)
 
-    # add post
+    # add post (creator's counter and followers' timelines are updated on save)
     post = Post(
         created_by = request.user,
         content = post_content
     )
-    post.save()
+    writer.write(post.save)
 
     return JsonResponse({"message": "Post created successfully."}, status=201) 
 
@@ -202,10 +406,10 @@ def follow(request, user_id):
         if data.get('isfollowing') is not None:
             # follow
             if data['isfollowing']:
-                request.user.follow(p_user)
+                writer.write(request.user.follow, p_user)
                 # print('follow successful')
             else:
-                request.user.unfollow(p_user)
+                writer.write(request.user.unfollow, p_user)
                 # print('unfollow successful')
         else:
             print('no data')
@@ -215,4 +419,39 @@ def follow(request, user_id):
     else:
         return JsonResponse({
             "error": "GET or PUT request required."
-        }, status=400)
\ No newline at end of file
+        }, status=400)
+
+
+@login_required
+def follow_statuses(request):
+    """ Returns follow status of the logged in user for every user in ?ids=1,2,3 """
+
+    # follow statuses must be via GET
+    if request.method != "GET":
+        return JsonResponse({"error": "GET request required."}, status=400)
+
+    user_ids = get_ids(request)
+    if user_ids is None:
+        return JsonResponse({"error": "Invalid user ids."}, status=400)
+
+    followed_ids = request.user.get_followed_ids(user_ids)
+    return JsonResponse({
+        'isfollowing': {str(user_id): user_id in followed_ids for user_id in user_ids}
+    })
+
+
+def metrics_view(request):
+    """ Returns the metrics of network/metrics.py in the Prometheus text format. """
+    return HttpResponse(metrics.collect(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_member_required
+def slow_queries(request):
+    """ Shows the slow query log with the query plans, for staff only. """
+    if request.method == "POST":
+        slowlog.clear_slow_queries()
+        return HttpResponseRedirect(reverse("slow_queries"))
+    return render(request, "network/slow_queries.html", {
+        "slow_queries": slowlog.get_slow_queries(),
+        "threshold": getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None),
+    })
@@ -0,0 +1,123 @@
+"""
+Write path for SQLite, which allows one writer at a time.
+
+Every new SQLite connection is switched to WAL, so readers never wait for
+the writer, and told to wait for a busy database instead of failing. With
+WRITE_QUEUE enabled all writes of the API views run on one writer thread,
+which commits whatever queued up while it was busy in one transaction
+(group commit) instead of letting request threads fight over the lock.
+"""
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+logger = logging.getLogger(__name__)
+
+# most writes committed together
+MAX_BATCH = 100
+# seconds a request waits for its write
+WRITE_TIMEOUT = 30
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """ Sets the WAL journal and busy timeout on new SQLite connections. """
+    if connection.vendor != 'sqlite':
+        return
+    timeout = connection.settings_dict['OPTIONS'].get('timeout', 5)
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(timeout * 1000)}')
+
+
+class Writer:
+    """ Runs queued write functions on one thread, committing each batch in one transaction. """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name='db-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        """ Queues func(*args, **kwargs) and returns a Future of its result. """
+        future = Future()
+        self.queue.put((future, func, args, kwargs))
+        return future
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            close_old_connections()
+            write_batch(batch)
+
+
+def write_batch(batch):
+    """ Runs a batch of (future, func, args, kwargs) in one transaction and resolves the futures. """
+    results = []
+    try:
+        with transaction.atomic():
+            for future, func, args, kwargs in batch:
+                # a savepoint per write, so a failing write does not undo the others
+                try:
+                    with transaction.atomic():
+                        results.append((future, func(*args, **kwargs), None))
+                except Exception as e:
+                    results.append((future, None, e))
+    except Exception as e:
+        logger.exception('Committing %d writes failed.', len(batch))
+        for future, *_ in batch:
+            future.set_exception(e)
+        return
+
+    for future, result, error in results:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+
+writer = None
+writer_lock = threading.Lock()
+
+
+def get_writer():
+    """ Returns the writer of this process, or None if WRITE_QUEUE is not enabled. """
+    global writer
+    if not getattr(settings, 'WRITE_QUEUE', False):
+        return None
+    with writer_lock:
+        if writer is None:
+            writer = Writer()
+    return writer
+
+
+def write(func, *args, **kwargs):
+    """ Runs func(*args, **kwargs) in a transaction, on the writer thread if it is enabled. """
+    queued = get_writer()
+    # writes made by a queued write join its transaction
+    if queued is None or threading.current_thread() is queued.thread:
+        with transaction.atomic():
+            return func(*args, **kwargs)
+    return queued.submit(func, *args, **kwargs).result(WRITE_TIMEOUT)
+
+
+async def awrite(func, *args, **kwargs):
+    """ Async version of write(), the event loop is free while the write waits. """
+    queued = get_writer()
+    if queued is None:
+        return await sync_to_async(write)(func, *args, **kwargs)
+    return await asyncio.wait_for(asyncio.wrap_future(queued.submit(func, *args, **kwargs)), WRITE_TIMEOUT)
@@ -31,7 +31,7 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
-    'network',
+    'network.apps.NetworkConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -41,7 +41,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'network.middleware.ProfilingMiddleware',
+    'network.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'network.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,7 +57,7 @@ ROOT_URLCONF = 'project4.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'network.profiling.ProfilingDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -78,11 +81,92 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'OPTIONS': {
+            # seconds to wait for the write lock before "database is locked"
+            'timeout': 20,
+            # take the write lock when a transaction starts: a transaction that read
+            # first cannot wait for the lock later and fails at once if it is taken
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # read replica, e.g. a copy made with: sqlite3 db.sqlite3 ".backup db-replica.sqlite3"
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db-replica.sqlite3'),
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
 }
 
+DATABASE_ROUTERS = ['network.routers.ReplicaRouter']
+
+# Aliases reads are spread over, empty to read from the primary only
+DATABASE_REPLICAS = []
+
+# Seconds a client keeps reading from the primary after it wrote, to see its own writes
+DATABASE_REPLICA_PIN_SECONDS = 5
+
 AUTH_USER_MODEL = "network.User"
 
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# Use a shared backend (e.g. memcached) when running more than one process.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'network',
+    }
+}
+
+# Sessions are read from the cache and written through to the database
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# request.user comes from the cache too, see network/backends.py
+AUTHENTICATION_BACKENDS = ['network.backends.CachedModelBackend']
+USER_CACHE_TIMEOUT = 60 * 5
+
+# Seconds the index page stays fresh in the cache for anonymous visitors, 0 disables it
+ANONYMOUS_PAGE_CACHE_TIMEOUT = 30
+
+# Seconds like toggles are collected in memory before they are written in one batch, 0 writes them at once
+LIKE_BUFFER_INTERVAL = 0
+
+# Run the writes of the API views on one writer thread with group commit (see network/writer.py)
+WRITE_QUEUE = False
+
+# Share of requests profiled by ProfilingMiddleware (Server-Timing header and a log line), 0 disables it
+PROFILING_SAMPLE_RATE = 0
+
+# Directory where every server process writes its metrics for /metrics to add them up (see network/metrics.py),
+# None serves the metrics of the answering process only
+METRICS_DIR = None
+METRICS_FLUSH_SECONDS = 5
+
+# Queries of the network app slower than this are kept with their query plan (see network/slowlog.py), None disables it
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_LOG_SIZE = 100
+# Directory where every server process writes its slow queries for the slow_queries command and page, e.g.
+# os.path.join(BASE_DIR, 'slow_queries'), None keeps them in the memory of the process only
+SLOW_QUERY_DIR = None
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'network.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -121,4 +205,12 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static'),]
-STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
\ No newline at end of file
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+# Uploaded files (user images and their thumbnails)
+# Uploads are never overwritten, so the web server serving MEDIA_ROOT in
+# production may send the same long-lived cache headers as project4/urls.py.
+
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_MAX_AGE = 60 * 60 * 24 * 365
\ No newline at end of file
@@ -18,6 +18,8 @@ from django.urls import include, path
 
 from django.contrib.staticfiles.urls import static, staticfiles_urlpatterns
 from django.conf import settings
+from django.views.decorators.cache import cache_control
+from django.views.static import serve
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -25,4 +27,8 @@ urlpatterns = [
 ]
 
 urlpatterns += staticfiles_urlpatterns()
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+urlpatterns += static(
+    settings.MEDIA_URL,
+    view=cache_control(public=True, max_age=settings.MEDIA_MAX_AGE, immutable=True)(serve),
+    document_root=settings.MEDIA_ROOT
+)
\ No newline at end of file